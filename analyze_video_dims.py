@@ -1,15 +1,31 @@
 #!/usr/bin/env python3
 """
 Script to analyze frame dimensions of real-world scene videos.
-Analyzes the concat.mp4 files for each scene mentioned in index.html.
+Analyzes the concat.mp4 files for each scene mentioned in index.html,
+or (with --root) every video under a directory, probing them concurrently
+with ffprobe and caching results by file size + mtime.
 """
 
-import cv2
+import argparse
+import csv
+import json
 import os
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+PROBE_CACHE = ".video_probe_cache.json"
+VIDEO_EXTS = (".mp4", ".mov", ".webm", ".mkv")
+FIELDS = [
+    "path", "width", "height", "fps", "frame_count", "duration", "codec", "pix_fmt",
+    "bit_rate", "keyframe_count", "keyframe_interval", "max_keyframe_interval", "source",
+]
+
 def analyze_video_dimensions(video_path):
     """Analyze video dimensions and return width, height, fps, and frame count."""
+    import cv2
+
     if not os.path.exists(video_path):
         return None
     
@@ -33,46 +49,117 @@ def analyze_video_dimensions(video_path):
         'duration': frame_count / fps if fps > 0 else 0
     }
 
-def main():
-    # Scene names from index.html
-    scenes = [
-        "bouquet",
-        "bonsai", 
-        "vasedeck",
-        "burger_combine",
-        "bun",
-        "dog"
-    ]
-    
-    base_path = "static/videos/ours_real_world/renders"
-    
-    print("Video Dimension Analysis")
-    print("=" * 50)
-    
-    all_dims = []
-    
-    for scene in scenes:
-        video_path = os.path.join(base_path, scene, "concat.mp4")
-        print(f"\nAnalyzing: {scene}")
-        print(f"Path: {video_path}")
-        
+def _rate(text):
+    """Parse an ffprobe rational such as '30000/1001'."""
+    num, _, den = (text or "0/0").partition("/")
+    try:
+        return float(num) / float(den or 1)
+    except (ValueError, ZeroDivisionError):
+        return 0.0
+
+def probe_video(video_path):
+    """Read container metadata with ffprobe: real packet count, fps, codec, pix_fmt,
+    bitrate and keyframe spacing. Packets are counted, nothing is decoded.
+    Falls back to OpenCV (fewer fields) when ffprobe is not installed."""
+    if not os.path.exists(video_path):
+        return None
+    try:
+        out = subprocess.run(
+            ["ffprobe", "-v", "error", "-select_streams", "v:0", "-count_packets",
+             "-show_entries",
+             "stream=width,height,codec_name,pix_fmt,avg_frame_rate,r_frame_rate,bit_rate,nb_read_packets"
+             ":format=duration,bit_rate:packet=flags",
+             "-of", "json", video_path],
+            check=True, capture_output=True, text=True,
+        ).stdout
+    except FileNotFoundError:
         dims = analyze_video_dimensions(video_path)
-        
-        if dims is None:
-            print(f"❌ Could not analyze video (file not found or corrupted)")
-            continue
-            
-        print(f"✅ Dimensions: {dims['width']} x {dims['height']}")
-        print(f"   FPS: {dims['fps']:.2f}")
-        print(f"   Frames: {dims['frame_count']}")
-        print(f"   Duration: {dims['duration']:.2f}s")
-        
-        all_dims.append({
-            'scene': scene,
-            **dims
-        })
-    
-    # Summary
+        return None if dims is None else {"path": video_path, **dims, "source": "opencv"}
+    except subprocess.CalledProcessError:
+        return None
+
+    info = json.loads(out)
+    if not info.get("streams"):
+        return None
+    stream, fmt = info["streams"][0], info.get("format", {})
+
+    frame_count = int(stream.get("nb_read_packets") or 0)
+    duration = float(fmt.get("duration") or 0)
+    fps = _rate(stream.get("avg_frame_rate")) or _rate(stream.get("r_frame_rate"))
+    if duration > 0 and frame_count > 0 and fps == 0:
+        fps = frame_count / duration
+
+    key_idx = [i for i, pkt in enumerate(info.get("packets", [])) if "K" in pkt.get("flags", "")]
+    gaps = [b - a for a, b in zip(key_idx, key_idx[1:])]
+
+    return {
+        "path": video_path,
+        "width": int(stream.get("width") or 0),
+        "height": int(stream.get("height") or 0),
+        "fps": fps,
+        "frame_count": frame_count,
+        "duration": duration,
+        "codec": stream.get("codec_name"),
+        "pix_fmt": stream.get("pix_fmt"),
+        "bit_rate": int(stream.get("bit_rate") or fmt.get("bit_rate") or 0),
+        "keyframe_count": len(key_idx),
+        "keyframe_interval": sum(gaps) / len(gaps) if gaps else frame_count,
+        "max_keyframe_interval": max(gaps) if gaps else frame_count,
+        "source": "ffprobe",
+    }
+
+def probe_videos(paths, workers=8, cache_path=PROBE_CACHE):
+    """Probe many videos concurrently. Results are cached by (size, mtime) in *cache_path*
+    (pass None to disable). Returns {path: result or None} in input order."""
+    cache = {}
+    if cache_path and os.path.exists(cache_path):
+        with open(cache_path) as f:
+            cache = json.load(f)
+
+    def sig(path):
+        st = os.stat(path)
+        return [st.st_size, st.st_mtime_ns]
+
+    results, todo = {}, []
+    for p in paths:
+        entry = cache.get(os.path.abspath(p))
+        if entry is not None and os.path.exists(p) and entry["sig"] == sig(p):
+            results[p] = entry["result"]
+        else:
+            todo.append(p)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for p, res in zip(todo, pool.map(probe_video, todo)):
+            results[p] = res
+            if res is not None and res["source"] == "ffprobe":
+                cache[os.path.abspath(p)] = {"sig": sig(p), "result": res}
+
+    if cache_path and todo:
+        tmp = cache_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(cache, f, indent=1)
+        os.replace(tmp, cache_path)
+    return {p: results[p] for p in paths}
+
+def find_videos(root):
+    return sorted(str(p) for p in Path(root).rglob("*") if p.suffix.lower() in VIDEO_EXTS and not p.name.startswith("._"))
+
+def write_records(records, fmt, out=None):
+    """Emit probe records as JSON or CSV to *out* (a path) or stdout."""
+    fh = open(out, "w", newline="") if out else sys.stdout
+    try:
+        if fmt == "json":
+            json.dump(records, fh, indent=2)
+            fh.write("\n")
+        else:
+            writer = csv.DictWriter(fh, fieldnames=FIELDS, extrasaction="ignore")
+            writer.writeheader()
+            writer.writerows(records)
+    finally:
+        if out:
+            fh.close()
+
+def print_summary(all_dims):
     if all_dims:
         print("\n" + "=" * 50)
         print("SUMMARY")
@@ -107,5 +194,69 @@ def main():
     else:
         print("\n❌ No videos could be analyzed")
 
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Probe video dimensions, fps, codec and keyframe spacing.")
+    parser.add_argument("--root", default=None,
+                        help="Probe every video under this directory (e.g. static/videos) instead of the real-world scenes.")
+    parser.add_argument("--format", choices=["text", "json", "csv"], default="text", help="Output format")
+    parser.add_argument("--out", default=None, help="Write JSON/CSV here instead of stdout")
+    parser.add_argument("--workers", type=int, default=8, help="Concurrent ffprobe processes")
+    parser.add_argument("--no_cache", action="store_true", help="Ignore and do not update the probe cache")
+    args = parser.parse_args(argv)
+
+    # Scene names from index.html
+    scenes = [
+        "bouquet",
+        "bonsai", 
+        "vasedeck",
+        "burger_combine",
+        "bun",
+        "dog"
+    ]
+    
+    base_path = "static/videos/ours_real_world/renders"
+
+    if args.root:
+        labelled = [(os.path.relpath(p, args.root), p) for p in find_videos(args.root)]
+    else:
+        labelled = [(scene, os.path.join(base_path, scene, "concat.mp4")) for scene in scenes]
+
+    results = probe_videos([p for _, p in labelled], workers=args.workers,
+                           cache_path=None if args.no_cache else PROBE_CACHE)
+
+    if args.format != "text":
+        write_records([r for r in results.values() if r is not None], args.format, args.out)
+        return
+
+    print("Video Dimension Analysis")
+    print("=" * 50)
+    
+    all_dims = []
+    
+    for scene, video_path in labelled:
+        print(f"\nAnalyzing: {scene}")
+        print(f"Path: {video_path}")
+        
+        dims = results[video_path]
+        
+        if dims is None:
+            print(f"❌ Could not analyze video (file not found or corrupted)")
+            continue
+            
+        print(f"✅ Dimensions: {dims['width']} x {dims['height']}")
+        print(f"   FPS: {dims['fps']:.2f}")
+        print(f"   Frames: {dims['frame_count']}")
+        print(f"   Duration: {dims['duration']:.2f}s")
+        if dims.get("codec"):
+            print(f"   Codec: {dims['codec']} ({dims['pix_fmt']}), {dims['bit_rate'] / 1e6:.2f} Mb/s")
+            print(f"   Keyframe interval: {dims['keyframe_interval']:.1f} frames (max {dims['max_keyframe_interval']})")
+        
+        all_dims.append({
+            'scene': scene,
+            **dims
+        })
+    
+    print_summary(all_dims)
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+"""
+benchmark_media.py ─ Performance baseline for the media scripts.
+- Generates deterministic synthetic 5-pane concat clips and PNG frame folders.
+- Runs each entry point (compositor, split renderer, title overlay, crop/resize,
+  encode, probe) at several resolutions and clip lengths.
+- Reports frames/sec, wall time and peak RSS; writes a JSON baseline and can
+  compare a run against an earlier one.
+- --startup instead times the cold start of every pixie_media.py command and fails
+  when a lightweight one exceeds its budget or imports a heavy module it doesn't need;
+  its results go to benchmark_startup.json.
+
+Each case runs in a fresh process so its peak RSS is not polluted by earlier cases.
+"""
+
+import argparse
+import json
+import multiprocessing as mp
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from pixie_media import COMMANDS, HEAVY_MODULES, STARTUP_ALLOWED, STARTUP_BUDGET_S
+
+REPO = Path(__file__).resolve().parent
+
+SIZES = {
+    "small": (320, 180),
+    "medium": (960, 540),
+}
+LENGTHS = [40, 120]
+BENCHMARKS = ["compositor", "split", "title", "crop_resize", "encode", "probe"]
+
+
+# -----------------------------------------------------------------------------
+# Synthetic inputs
+# -----------------------------------------------------------------------------
+
+
+def synthetic_frame(idx: int, pane_w: int, pane_h: int, panes: int = 5) -> np.ndarray:
+    """Deterministic BGR concat frame: a moving gradient per pane plus fixed seeded noise."""
+    rng = np.random.RandomState(panes * 1000 + pane_h)
+    noise = rng.randint(0, 32, (pane_h, pane_w, 3), dtype=np.uint8)
+    xs = np.arange(pane_w, dtype=np.int32)[None, :]
+    ys = np.arange(pane_h, dtype=np.int32)[:, None]
+    out = np.empty((pane_h, pane_w * panes, 3), dtype=np.uint8)
+    for p in range(panes):
+        base = (xs * 3 + ys * (p + 1) + idx * 4 + p * 50) % 224
+        pane = out[:, p * pane_w:(p + 1) * pane_w]
+        pane[..., 0] = base
+        pane[..., 1] = (base + 64 * p) % 224
+        pane[..., 2] = 223 - base
+        pane += noise
+    return out
+
+
+def make_concat_clip(path: Path, pane_w: int, pane_h: int, n_frames: int, fps: int = 30):
+    if path.exists():
+        return path
+    path.parent.mkdir(parents=True, exist_ok=True)
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*"mp4v"), fps, (pane_w * 5, pane_h))
+    for i in range(n_frames):
+        writer.write(synthetic_frame(i, pane_w, pane_h))
+    writer.release()
+    return path
+
+
+def make_frame_folder(path: Path, width: int, height: int, n_frames: int):
+    if path.exists() and len(list(path.glob("*.png"))) == n_frames:
+        return path
+    path.mkdir(parents=True, exist_ok=True)
+    for i in range(n_frames):
+        cv2.imwrite(str(path / f"{i:05d}.png"), synthetic_frame(i, width, height, panes=1))
+    return path
+
+
+# -----------------------------------------------------------------------------
+# Benchmark cases (each returns the number of frames processed)
+# -----------------------------------------------------------------------------
+
+
+class _NullWriter:
+    def __init__(self):
+        self.frames = 0
+
+    def write(self, frame):
+        self.frames += 1
+
+
+def bench_compositor(ctx):
+    import gen_realworld_demo
+
+    gen_realworld_demo.VIDEO_PATHS = {"bench": str(ctx["clip"])}
+    gen_realworld_demo.repeats = {"bench": 1}
+    writer = _NullWriter()
+    gen_realworld_demo.process_scene("bench", writer, (ctx["pane_w"], ctx["pane_h"]))
+    return writer.frames
+
+
+def bench_split(ctx):
+    import gen_bouquet_rgb_material
+
+    gen_bouquet_rgb_material.main(str(ctx["clip"]), str(ctx["work"] / "split.mp4"), "Bench", repeat=1, force=True)
+    return ctx["n_frames"]
+
+
+def bench_title(ctx):
+    import gen_text
+
+    font = REPO / "Cochin_Bold" / "Cochin_Bold.otf"
+    make_rgba = gen_text.make_title_renderer(str(font))
+    for i in range(ctx["n_frames"]):
+        t = i / 30.0
+        make_rgba(t)[..., :3]   # colour clip
+        make_rgba(t)[..., 3]    # mask clip (served from the per-t cache)
+    return ctx["n_frames"]
+
+
+def bench_crop_resize(ctx):
+    import make_realworld_web_viz as web
+
+    web.process_frames(ctx["frames"], (8, 8, 8, 8), ctx["work"] / "processed", workers=ctx["workers"])
+    return ctx["n_frames"]
+
+
+def bench_encode(ctx):
+    import make_realworld_web_viz as web
+
+    web.encode_frames_streaming(ctx["frames"], (8, 8, 8, 8), ctx["work"] / "encoded.mp4", 30, workers=ctx["workers"])
+    return ctx["n_frames"]
+
+
+def bench_probe(ctx):
+    import analyze_video_dims
+
+    results = analyze_video_dims.probe_videos([str(ctx["clip"])] * 8, workers=8, cache_path=None)
+    return sum(r["frame_count"] for r in results.values() if r)
+
+
+CASES = {
+    "compositor": bench_compositor,
+    "split": bench_split,
+    "title": bench_title,
+    "crop_resize": bench_crop_resize,
+    "encode": bench_encode,
+    "probe": bench_probe,
+}
+
+
+def _run_case(name, ctx, queue):
+    sys.path.insert(0, str(REPO))
+    os.chdir(ctx["work"])  # keep build-cache manifests out of the repo
+    try:
+        t0, c0 = time.perf_counter(), time.process_time()
+        frames = CASES[name](ctx)
+        wall, cpu = time.perf_counter() - t0, time.process_time() - c0
+        # ru_maxrss is KiB on Linux, bytes on macOS
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        rss_mb = rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+        queue.put({"frames": frames, "wall_s": wall, "cpu_s": cpu,
+                   "fps": frames / wall if wall > 0 else 0.0, "peak_rss_mb": rss_mb})
+    except Exception as e:  # reported, not fatal: one missing dependency shouldn't stop the suite
+        queue.put({"error": f"{type(e).__name__}: {e}"})
+
+
+def run_case(name, ctx):
+    spawn = mp.get_context("spawn")
+    queue = spawn.Queue()
+    proc = spawn.Process(target=_run_case, args=(name, ctx, queue))
+    proc.start()
+    proc.join()
+    return queue.get() if not queue.empty() else {"error": f"exit code {proc.exitcode}"}
+
+
+# -----------------------------------------------------------------------------
+# Cold start of the pixie_media.py commands
+# -----------------------------------------------------------------------------
+
+
+def measure_startup(command, repeats=5):
+    """Best-of-*repeats* wall time of `pixie_media.py <command> --help` in a fresh interpreter,
+    plus the heavy modules it imported."""
+    cmd = [str(REPO / "pixie_media.py"), command, "--help"]
+    best = float("inf")
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        proc = subprocess.run([sys.executable, *cmd], cwd=REPO, capture_output=True, text=True)
+        best = min(best, time.perf_counter() - t0)
+        if proc.returncode != 0:
+            return {"error": proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else f"exit code {proc.returncode}"}
+    trace = subprocess.run([sys.executable, "-X", "importtime", *cmd], cwd=REPO, capture_output=True, text=True).stderr
+    imported = {line.rsplit("|", 1)[-1].strip().split(".")[0]
+                for line in trace.splitlines() if line.startswith("import time:")}
+    return {"wall_s": best, "heavy_imports": sorted(imported & set(HEAVY_MODULES))}
+
+
+def check_startup(repeats=5):
+    """Measure every command; return (results, failures) where failures break a budget."""
+    bare = float("inf")
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "pass"], check=True)
+        bare = min(bare, time.perf_counter() - t0)
+    print(f"{'command':10s} {'cold start':>10s} {'budget':>8s}  heavy imports   (bare interpreter {bare:.3f}s)")
+
+    results, failures = {}, []
+    for command in COMMANDS:
+        res = results[command] = measure_startup(command, repeats)
+        if "error" in res:
+            print(f"❌ {command:8s} {res['error']}")
+            continue
+        budget = STARTUP_BUDGET_S.get(command)
+        extra = set(res["heavy_imports"]) - STARTUP_ALLOWED.get(command, set(HEAVY_MODULES))
+        ok = (budget is None or res["wall_s"] <= budget) and not extra
+        if not ok:
+            failures.append(command)
+        flag = "" if ok else f"  ⚠️ {'unexpected ' + ', '.join(sorted(extra)) if extra else 'over budget'}"
+        budget_s = f"{budget:.2f}s" if budget is not None else "-"
+        print(f"{'✅' if ok else '❌'} {command:8s} {res['wall_s']:9.3f}s {budget_s:>8s}  "
+              f"{', '.join(res['heavy_imports']) or '-'}{flag}")
+    return {"bare_interpreter_s": bare, "commands": results}, failures
+
+
+# -----------------------------------------------------------------------------
+# Reporting
+# -----------------------------------------------------------------------------
+
+
+def compare(current, baseline, threshold):
+    """Print per-case fps ratios against *baseline*; return the list of regressions."""
+    base = {r["id"]: r for r in baseline["results"]}
+    regressions = []
+    print(f"\n{'case':40s} {'base fps':>10s} {'fps':>10s} {'ratio':>7s}")
+    for r in current["results"]:
+        b = base.get(r["id"])
+        if b is None or "fps" not in b or "fps" not in r:
+            continue
+        ratio = r["fps"] / b["fps"] if b["fps"] else float("inf")
+        flag = ""
+        if ratio < 1 - threshold:
+            flag = "  ⚠️ slower"
+            regressions.append(r["id"])
+        print(f"{r['id']:40s} {b['fps']:10.1f} {r['fps']:10.1f} {ratio:7.2f}{flag}")
+    return regressions
+
+
+def main():
+    p = argparse.ArgumentParser(description="Benchmark the media scripts on synthetic inputs.",
+                                formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    p.add_argument("--only", nargs="+", choices=BENCHMARKS, default=BENCHMARKS, help="Benchmarks to run")
+    p.add_argument("--sizes", nargs="+", choices=list(SIZES), default=list(SIZES), help="Pane resolutions")
+    p.add_argument("--lengths", nargs="+", type=int, default=LENGTHS, help="Clip lengths in frames")
+    p.add_argument("--workers", type=int, default=os.cpu_count(), help="Workers for pooled stages")
+    p.add_argument("--data_dir", default=os.path.join(tempfile.gettempdir(), "pixie_bench"),
+                   help="Where synthetic inputs are generated (reused across runs)")
+    p.add_argument("--out", default=None,
+                   help="JSON file to write results to (default: benchmark_results.json, or "
+                        "benchmark_startup.json with --startup so a baseline for --compare is not overwritten)")
+    p.add_argument("--compare", default=None, help="Baseline JSON to compare against")
+    p.add_argument("--threshold", type=float, default=0.10, help="Relative fps drop reported as a regression")
+    p.add_argument("--startup", action="store_true",
+                   help="Only time the cold start of the pixie_media.py commands against their budgets")
+    p.add_argument("--repeats", type=int, default=5, help="Cold-start runs per command (the best is kept)")
+    args = p.parse_args()
+    if args.out is None:
+        args.out = "benchmark_startup.json" if args.startup else "benchmark_results.json"
+
+    if args.startup:
+        startup, failures = check_startup(args.repeats)
+        with open(args.out, "w") as f:
+            json.dump({"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "startup": startup}, f, indent=2)
+        print(f"Wrote {args.out}")
+        sys.exit(1 if failures else 0)
+
+    data = Path(args.data_dir)
+    results = []
+    for size in args.sizes:
+        pane_w, pane_h = SIZES[size]
+        for n in args.lengths:
+            clip = make_concat_clip(data / f"concat_{size}_{n}.mp4", pane_w, pane_h, n)
+            frames = make_frame_folder(data / f"frames_{size}_{n}", pane_w * 2, pane_h * 2, n)
+            for name in args.only:
+                work = Path(tempfile.mkdtemp(prefix=f"{name}_", dir=data))
+                ctx = {"clip": clip, "frames": frames, "work": work, "n_frames": n,
+                       "pane_w": pane_w, "pane_h": pane_h, "workers": args.workers}
+                case_id = f"{name}/{size}/{n}"
+                res = {"id": case_id, "benchmark": name, "size": size, "n_frames": n, **run_case(name, ctx)}
+                shutil.rmtree(work, ignore_errors=True)
+                results.append(res)
+                if "error" in res:
+                    print(f"❌ {case_id:32s} {res['error']}")
+                else:
+                    print(f"✅ {case_id:32s} {res['fps']:9.1f} fps  {res['wall_s']:7.2f}s  {res['peak_rss_mb']:7.1f} MB")
+
+    commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO,
+                            capture_output=True, text=True).stdout.strip()
+    report = {
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "machine": {"platform": platform.platform(), "python": platform.python_version(), "cpus": os.cpu_count()},
+        "results": results,
+    }
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {args.out}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
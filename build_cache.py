@@ -0,0 +1,100 @@
+"""
+build_cache.py ─ Content-hash incremental build cache shared by the media scripts.
+- A stage is keyed by the SHA-256 of its input files plus the parameters that affect its output.
+- Keys and output stats are stored in a JSON manifest; unchanged stages are skipped.
+- File digests are memoised by (size, mtime) so a no-op rebuild does not re-read every frame.
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+
+
+DEFAULT_MANIFEST = ".build_cache.json"
+
+
+def _stat_sig(path):
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+
+def expand_inputs(inputs):
+    """Expand directories into their (sorted) files; keep plain files as-is."""
+    files = []
+    for p in inputs:
+        p = Path(p)
+        if p.is_dir():
+            files += sorted(f for f in p.rglob("*") if f.is_file())
+        else:
+            files.append(p)
+    return files
+
+
+class BuildCache:
+    """Skip build stages whose inputs and parameters have not changed since the last run."""
+
+    def __init__(self, manifest_path: str = DEFAULT_MANIFEST, force: bool = False):
+        self.manifest_path = Path(manifest_path)
+        self.force = force
+        try:
+            with open(self.manifest_path, "r") as f:
+                self.manifest = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.manifest = {}
+        self.manifest.setdefault("files", {})
+        self.manifest.setdefault("stages", {})
+
+    # ------------------------------------------------------------------ hashing
+    def file_digest(self, path) -> str:
+        """SHA-256 of a file, reused from the manifest while its size and mtime are unchanged."""
+        key = str(Path(path).resolve())
+        sig = _stat_sig(path)
+        memo = self.manifest["files"].get(key)
+        if memo is not None and memo["sig"] == sig:
+            return memo["sha256"]
+
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        digest = h.hexdigest()
+        self.manifest["files"][key] = {"sig": sig, "sha256": digest}
+        return digest
+
+    def key(self, inputs, params=None) -> str:
+        """Stage key from the content of *inputs* (files or directories) and *params*."""
+        h = hashlib.sha256()
+        for f in expand_inputs(inputs):
+            h.update(str(f).encode())
+            h.update(self.file_digest(f).encode() if f.exists() else b"<missing>")
+        h.update(json.dumps(params or {}, sort_keys=True, default=str).encode())
+        return h.hexdigest()
+
+    # ------------------------------------------------------------------ stages
+    def is_fresh(self, stage: str, key: str, outputs) -> bool:
+        """True when *stage* was last built with *key* and its outputs are still untouched."""
+        if self.force:
+            return False
+        entry = self.manifest["stages"].get(stage)
+        if entry is None or entry["key"] != key:
+            return False
+        for out in outputs:
+            out = str(out)
+            if not os.path.exists(out) or _stat_sig(out) != entry["outputs"].get(out):
+                return False
+        return True
+
+    def record(self, stage: str, key: str, outputs):
+        """Remember that *stage* produced *outputs* from *key* and persist the manifest."""
+        self.manifest["stages"][stage] = {
+            "key": key,
+            "outputs": {str(out): _stat_sig(out) for out in outputs if os.path.exists(out)},
+        }
+        self.save()
+
+    def save(self):
+        tmp = self.manifest_path.with_name(self.manifest_path.name + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump(self.manifest, f, indent=1, sort_keys=True)
+        os.replace(tmp, self.manifest_path)
@@ -0,0 +1,127 @@
+"""
+compositor.py ─ Fast split-screen compositor for the real-world demo videos.
+- Rasterizes each label (text + drop shadow) and the divider line once into a sprite.
+- Alpha-blends sprites into a preallocated output buffer with vectorized NumPy.
+- Reuses the same output buffer for every frame.
+
+Sprites are recovered by drawing each overlay onto a black and a white canvas:
+for every pixel the drawn result is modelled as  out = bg * K / 255 + C,
+with C taken from the black render and K = white - black. cv2's LINE_AA
+blending is not exactly linear in the background, so anti-aliased edge pixels
+may differ from a direct cv2.putText by at most SPRITE_TOLERANCE levels;
+fully covered and untouched pixels are bit-identical.
+"""
+
+import cv2
+import numpy as np
+
+from media_trace import stage
+
+
+FONT = cv2.FONT_HERSHEY_DUPLEX
+SPRITE_TOLERANCE = 2
+
+
+def put_text(img, text, org, font_scale, thickness, align_right=False, shadow_offset=2):
+    """Draw white text with a black drop shadow (reference, non-cached path)."""
+    (w, _), _ = cv2.getTextSize(text, FONT, font_scale, thickness)
+    x, y = org
+    if align_right:
+        x -= w
+    cv2.putText(img, text, (x + shadow_offset, y + shadow_offset), FONT, font_scale, (0, 0, 0), thickness + 1, cv2.LINE_AA)
+    cv2.putText(img, text, (x, y), FONT, font_scale, (255, 255, 255), thickness, cv2.LINE_AA)
+
+
+class Sprite:
+    """A pre-rasterized overlay restricted to the bounding box of the pixels it touches."""
+
+    def __init__(self, draw_fn, shape):
+        black = np.zeros(shape, dtype=np.uint8)
+        white = np.full(shape, 255, dtype=np.uint8)
+        draw_fn(black)
+        draw_fn(white)
+
+        touched = (black != 0) | (white != 255)
+        ys, xs = np.nonzero(touched.any(axis=2))
+        if len(ys) == 0:
+            self.box = None
+            return
+        y0, y1, x0, x1 = ys.min(), ys.max() + 1, xs.min(), xs.max() + 1
+        self.box = (y0, y1, x0, x1)
+
+        c = black[y0:y1, x0:x1]
+        k = white[y0:y1, x0:x1].astype(np.uint16) - c
+        self.k = k
+        self.c = c.astype(np.uint16)
+        self._tmp = np.empty(k.shape, dtype=np.uint16)
+
+    def blit(self, img):
+        """Blend the sprite into *img* in place."""
+        if self.box is None:
+            return
+        y0, y1, x0, x1 = self.box
+        roi = img[y0:y1, x0:x1]
+        tmp = self._tmp
+        np.multiply(roi, self.k, out=tmp)
+        tmp += 127
+        tmp //= 255
+        tmp += self.c
+        roi[...] = tmp
+
+
+class SplitCompositor:
+    """Compose "left half of pane A | right half of pane B" frames with labels and a divider."""
+
+    def __init__(self, height, pane_w, font_scale, thickness=2, margin=None, shadow_offset=2, line_thickness=4):
+        self.height = height
+        self.pane_w = pane_w
+        self.half = pane_w // 2
+        self.font_scale = font_scale
+        self.thickness = thickness
+        self.margin = int(15 * font_scale) if margin is None else margin
+        self.shadow_offset = shadow_offset
+        (_, self.text_h), _ = cv2.getTextSize("RGB", FONT, font_scale, thickness)
+
+        self._shape = (height, pane_w, 3)
+        self._buf = np.empty(self._shape, dtype=np.uint8)
+        self._sprite_cache = {}
+        self._line = Sprite(
+            lambda img: cv2.line(img, (self.half, 0), (self.half, height), (255, 255, 255), line_thickness),
+            self._shape,
+        )
+        self._labels = []
+
+    def _label_sprite(self, text, org, align_right):
+        key = (text, org, align_right)
+        sprite = self._sprite_cache.get(key)
+        if sprite is None:
+            sprite = Sprite(
+                lambda img: put_text(img, text, org, self.font_scale, self.thickness,
+                                     align_right=align_right, shadow_offset=self.shadow_offset),
+                self._shape,
+            )
+            self._sprite_cache[key] = sprite
+        return sprite
+
+    def set_labels(self, left, right, bottom):
+        """Select the three labels drawn on subsequent frames (top-left, top-right, bottom-left)."""
+        top_y = self.margin + self.text_h
+        with stage("text"):
+            self._labels = [
+                self._label_sprite(left, (self.margin, top_y), False),
+                self._label_sprite(right, (self.pane_w - self.margin, top_y), True),
+                self._label_sprite(bottom, (self.margin, self.height - self.margin), False),
+            ]
+
+    def compose(self, left_pane, right_pane, out=None):
+        """Return the composited frame; by default written into a buffer reused across calls."""
+        out = self._buf if out is None else out
+        half = self.half
+        with stage("composite", 1):
+            out[:, :half] = left_pane[:, :half]
+            out[:, half:] = right_pane[:, half:]
+        with stage("text", 1):
+            self._line.blit(out)
+            for sprite in self._labels:
+                sprite.blit(out)
+        return out
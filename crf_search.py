@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+crf_search.py ─ Pick the largest x264 CRF that still meets a quality target.
+- Encodes a few sampled segments at candidate CRFs (binary search) with the same
+  writer settings as the final encode, decodes them back and scores them against
+  the reference frames with SSIM (luma, 8x8 windows) or PSNR computed in NumPy.
+- The worst segment has to meet the target, so the guarantee holds for every sample,
+  not just on average.
+- The choice (CRF, scores, sample sizes per probe) is recorded in crf.json next to the
+  output video.
+- As a script: re-encode a video to the smallest CRF-controlled file that meets the
+  target, measured against that video (e.g. a near-lossless master).
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+import ffmpeg_runner
+import video_writer
+
+CRF_RANGE = (14, 36)      # searched range, best quality first
+SEGMENTS = 3              # sampled segments per source
+SEGMENT_FRAMES = 30
+SSIM_WINDOW = 8
+SSIM_STRIDE = 4           # window positions are sampled every 4 px, as ffmpeg's ssim filter does
+MANIFEST_NAME = "crf.json"
+
+
+# -----------------------------------------------------------------------------
+# Metrics
+# -----------------------------------------------------------------------------
+
+
+def _luma(frame):
+    """BT.601 luma of a BGR uint8 frame as float64."""
+    return frame @ np.array([0.114, 0.587, 0.299])
+
+
+def _window_means(x, win, stride):
+    """Mean of every win×win window whose corner lies on the stride grid (integral image)."""
+    c = np.zeros((x.shape[0] + 1, x.shape[1] + 1))
+    np.cumsum(x, axis=0, out=c[1:, 1:])
+    np.cumsum(c[1:, 1:], axis=1, out=c[1:, 1:])
+    a, b = c[:-win:stride, :-win:stride], c[win::stride, win::stride]
+    return (b - c[win::stride, :-win:stride] - c[:-win:stride, win::stride] + a) / (win * win)
+
+
+def ssim(ref, test, win=SSIM_WINDOW, stride=SSIM_STRIDE):
+    """Mean luma SSIM of two BGR frames over uniform win×win windows."""
+    x, y = _luma(ref), _luma(test)
+    mx, my = _window_means(x, win, stride), _window_means(y, win, stride)
+    vx = _window_means(x * x, win, stride) - mx * mx
+    vy = _window_means(y * y, win, stride) - my * my
+    cov = _window_means(x * y, win, stride) - mx * my
+    c1, c2 = (0.01 * 255) ** 2, (0.03 * 255) ** 2
+    s = (2 * mx * my + c1) * (2 * cov + c2) / ((mx * mx + my * my + c1) * (vx + vy + c2))
+    return float(s.mean())
+
+
+def psnr(ref, test):
+    """PSNR (dB) over all channels of two uint8 frames; capped at 100 for identical frames."""
+    diff = ref.astype(np.int16) - test
+    mse = float(np.mean(diff.astype(np.int32) ** 2))
+    return 100.0 if mse == 0 else 10 * np.log10(255.0 ** 2 / mse)
+
+
+METRICS = {"ssim": ssim, "psnr": psnr}
+
+
+# -----------------------------------------------------------------------------
+# Sampling and probing
+# -----------------------------------------------------------------------------
+
+
+def sample_video(path, segments=SEGMENTS, length=SEGMENT_FRAMES):
+    """(frames per segment, fps): *segments* evenly spaced runs of *length* frames from a video."""
+    cap = cv2.VideoCapture(str(path))
+    if not cap.isOpened():
+        raise RuntimeError(f"Cannot open {path}")
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    n = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    length = min(length, n) if n > 0 else length
+    starts = [round(i * (n - length) / max(segments - 1, 1)) for i in range(segments)] if n > length else [0]
+    samples = []
+    for start in sorted(set(starts)):
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+        frames = []
+        while len(frames) < length:
+            ok, frame = cap.read()
+            if not ok:
+                break
+            frames.append(frame)
+        if frames:
+            samples.append(frames)
+    cap.release()
+    if not samples:
+        raise RuntimeError(f"No frames could be read from {path}")
+    return samples, fps
+
+
+def probe(samples, fps, crf, metric="ssim", backend="ffmpeg", **options):
+    """Encode each sampled segment at *crf*; return (worst per-segment mean score, total bytes)."""
+    score_fn = METRICS[metric]
+    worst, total = float("inf"), 0
+    with tempfile.TemporaryDirectory(prefix="crf_probe_") as tmp:
+        for i, frames in enumerate(samples):
+            path = os.path.join(tmp, f"{i}.mp4")
+            h, w = frames[0].shape[:2]
+            writer = video_writer.open_writer(path, (w, h), fps, backend, **{**options, "crf": crf, "bitrate": None})
+            for frame in frames:
+                writer.write(frame)
+            writer.close()
+            total += os.path.getsize(path)
+
+            cap = cv2.VideoCapture(path)
+            scores = []
+            for ref in frames:
+                ok, dec = cap.read()
+                if not ok:
+                    break
+                scores.append(score_fn(ref, dec))
+            cap.release()
+            if len(scores) != len(frames):
+                raise RuntimeError(f"Decoded {len(scores)} of {len(frames)} frames of the CRF {crf} probe")
+            worst = min(worst, float(np.mean(scores)))
+    return worst, total
+
+
+def search_crf(samples, fps, target, metric="ssim", crf_range=CRF_RANGE, backend="ffmpeg", **options):
+    """Largest CRF in *crf_range* whose worst sampled segment scores at least *target*.
+
+    Quality falls monotonically with CRF, so a binary search needs ~log2(range) probe
+    encodes. When even the lowest CRF misses the target, the lowest CRF is returned
+    (and "met" is False).
+    """
+    backend, options = video_writer.resolve(backend, **options)
+    if backend == "opencv" or not options["codec"].startswith("libx26"):
+        raise ValueError(f"CRF search needs libx264/libx265 through ffmpeg or imageio, not {backend}/{options['codec']}")
+    options = {k: v for k, v in options.items() if k not in ("crf", "bitrate")}  # set per probe
+
+    lo, hi = crf_range
+    probes = {}
+    best = None
+    while lo <= hi:
+        crf = (lo + hi) // 2
+        t0 = time.perf_counter()
+        score, size = probe(samples, fps, crf, metric, backend, **options)
+        probes[crf] = {"score": round(score, 5), "sample_bytes": size}
+        ok = score >= target
+        print(f"[crf] {crf:2d}: {metric} {score:.4f} {'≥' if ok else '<'} {target}  "
+              f"({size / 1e6:.2f} MB of samples, {time.perf_counter() - t0:.1f}s)")
+        if ok:
+            best, lo = crf, crf + 1
+        else:
+            hi = crf - 1
+    met = best is not None
+    if not met:
+        best = crf_range[0]
+        print(f"[WARN] even CRF {best} misses {metric} {target}; using CRF {best}")
+        if best not in probes:
+            score, size = probe(samples, fps, best, metric, backend, **options)
+            probes[best] = {"score": round(score, 5), "sample_bytes": size}
+    return {
+        "crf": best, "met": met, "metric": metric, "target": target, "score": probes[best]["score"],
+        "backend": backend, "preset": options["preset"], "codec": options["codec"],
+        "samples": [len(s) for s in samples], "probes": dict(sorted(probes.items())),
+    }
+
+
+def target_from_args(target_ssim=None, target_psnr=None):
+    """(metric, target) from the two mutually exclusive CLI options, or None."""
+    if target_ssim is not None and target_psnr is not None:
+        raise ValueError("Give either a target SSIM or a target PSNR, not both")
+    if target_ssim is not None:
+        return "ssim", target_ssim
+    if target_psnr is not None:
+        return "psnr", target_psnr
+    return None
+
+
+def record_choice(video_path, choice):
+    """Store *choice* for *video_path* in the crf.json manifest of its directory."""
+    manifest_path = os.path.join(os.path.dirname(os.path.abspath(video_path)), MANIFEST_NAME)
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+    entry = {**choice, "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S")}
+    if os.path.exists(video_path):
+        entry["bytes"] = os.path.getsize(video_path)
+    manifest[os.path.basename(video_path)] = entry
+    # A reader (or an interrupted build) never sees a half-written manifest
+    with ffmpeg_runner.atomic_output(manifest_path) as tmp, open(tmp, "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest_path
+
+
+def encode_to_target(src, dst, metric, target, preset="slow", crf_range=CRF_RANGE):
+    """Re-encode *src* into *dst* at the largest CRF meeting the target (measured against *src*).
+
+    The final encode goes through ffmpeg_runner (atomic output, progress, loud failure).
+    Returns the recorded choice.
+    """
+    samples, fps = sample_video(src)
+    choice = search_crf(samples, fps, target, metric, crf_range, backend="ffmpeg",
+                        codec="libx264", preset=preset)
+    os.makedirs(os.path.dirname(os.path.abspath(dst)), exist_ok=True)
+    with ffmpeg_runner.atomic_output(dst) as tmp:
+        ffmpeg_runner.run(["ffmpeg", "-y", "-i", src, "-map", "0:v", "-c:v", "libx264", "-preset", preset,
+                           "-crf", str(choice["crf"]), "-pix_fmt", "yuv420p", "-movflags", "+faststart", tmp],
+                          name=f"{os.path.basename(dst)} @ crf {choice['crf']}")
+    choice["source"] = os.path.basename(src)
+    choice["source_bytes"] = os.path.getsize(src)
+    manifest_path = record_choice(dst, choice)
+    print(f"✅ {dst}: CRF {choice['crf']} ({metric} ≥ {target}: {choice['met']}), "
+          f"{os.path.getsize(dst) / 1e6:.1f} MB vs {choice['source_bytes'] / 1e6:.1f} MB for {src}; "
+          f"recorded in {manifest_path}")
+    return choice
+
+
+def cli(argv=None):
+    p = argparse.ArgumentParser(description="Re-encode a video at the largest CRF that meets an SSIM/PSNR target.",
+                                formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    p.add_argument("input", help="Reference video (ideally a high-quality master)")
+    p.add_argument("output", help="Re-encoded video")
+    p.add_argument("--target_ssim", type=float, default=None, help="Minimum mean SSIM of every sampled segment")
+    p.add_argument("--target_psnr", type=float, default=None, help="Minimum mean PSNR (dB) of every sampled segment")
+    p.add_argument("--preset", default="slow", help="x264 preset for the probes and the final encode")
+    p.add_argument("--crf_range", type=int, nargs=2, default=list(CRF_RANGE), help="Lowest and highest CRF tried")
+    args = p.parse_args(argv)
+    target = target_from_args(args.target_ssim, args.target_psnr)
+    if target is None:
+        p.error("give --target_ssim or --target_psnr")
+    encode_to_target(args.input, args.output, *target, preset=args.preset, crf_range=tuple(args.crf_range))
+
+
+if __name__ == "__main__":
+    cli()
@@ -1,6 +1,23 @@
+"""
+extract_frame.py ─ Still frames and scrubbing previews from videos.
+- Single mode: first frame of one video → one image (original behaviour).
+- Batch mode (--videos): N evenly spaced or keyframe-aligned frames per video, reached
+  by seeking instead of decoding every frame, with videos processed in parallel.
+- Optional sprite sheet per video plus a JSON timing index for hover-scrub previews.
+"""
+
 import cv2
 import argparse
+import glob
+import json
+import math
 import os
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from analyze_video_dims import probe_video
 
 def extract_first_frame(video_path, output_path):
     """
@@ -37,10 +54,183 @@ def extract_first_frame(video_path, output_path):
     # Release the video capture object
     cap.release()
 
-if __name__ == "__main__":
-    parser = argparse.ArgumentParser(description="Extract the first frame from a video.")
-    parser.add_argument("video_path", type=str, help="Path to the input video file.")
-    parser.add_argument("output_path", type=str, help="Path to save the output PNG image.")
-    args = parser.parse_args()
+def keyframe_indices(video_path):
+    """Frame indices of the keyframes, from packet flags (nothing is decoded); None without ffprobe."""
+    try:
+        out = subprocess.run(
+            ["ffprobe", "-v", "error", "-select_streams", "v:0", "-show_entries", "packet=pts_time,flags",
+             "-of", "csv=p=0", video_path],
+            check=True, capture_output=True, text=True,
+        ).stdout
+    except (FileNotFoundError, subprocess.CalledProcessError):
+        return None
+    packets = []
+    for line in out.splitlines():
+        pts, _, flags = line.partition(",")
+        try:
+            packets.append((float(pts), "K" in flags))
+        except ValueError:
+            continue
+    packets.sort()  # decode order → presentation order
+    return [i for i, (_, key) in enumerate(packets) if key]
+
+
+def pick_frames(n_frames, count, keyframes=None):
+    """`count` frame indices spread over the clip; snapped to distinct keyframes when given."""
+    count = max(1, min(count, n_frames))
+    targets = [i * n_frames // count for i in range(count)]
+    if not keyframes:
+        return targets
+    if len(keyframes) <= count:
+        return list(keyframes)
+    picked = []
+    for t in targets:
+        k = min(keyframes, key=lambda kf: abs(kf - t))
+        if k not in picked:
+            picked.append(k)
+    return sorted(picked)
+
+
+def extract_frames(video_path, out_dir, count=8, mode="even", width=None, ext="jpg"):
+    """Seek to `count` frames of one video and write them to out_dir/frame_XXXXX.ext.
+
+    Returns [(frame index, time in seconds, image)] with images resized to `width` if given.
+    """
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise RuntimeError(f"Could not open video file '{video_path}'")
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    # ffprobe's packet count is exact; CAP_PROP_FRAME_COUNT is estimated from the
+    # container duration and can overshoot, which leaves the last picks unreadable
+    info = probe_video(video_path)
+    if info and info["frame_count"] > 0:
+        n_frames = info["frame_count"]
+    else:
+        n_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+
+    keyframes = keyframe_indices(video_path) if mode == "keyframe" else None
+    if mode == "keyframe" and keyframes is None:
+        print(f"[WARN] ffprobe unavailable; using evenly spaced frames for {video_path}")
+    if keyframes:
+        n_frames = max(n_frames, keyframes[-1] + 1)
+
+    os.makedirs(out_dir, exist_ok=True)
+    frames = []
+    try:
+        for idx in pick_frames(n_frames, count, keyframes):
+            # Seeking jumps to the preceding keyframe and decodes only up to idx
+            cap.set(cv2.CAP_PROP_POS_FRAMES, idx)
+            ret, frame = cap.read()
+            if not ret:
+                continue
+            if width and frame.shape[1] != width:
+                height = round(frame.shape[0] * width / frame.shape[1])
+                frame = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+            cv2.imwrite(os.path.join(out_dir, f"frame_{idx:05d}.{ext}"), frame)
+            frames.append((idx, idx / fps, frame))
+    finally:
+        cap.release()
+    return frames
+
 
-    extract_first_frame(args.video_path, args.output_path) 
\ No newline at end of file
+def write_sprite(frames, out_dir, cols=4, ext="jpg"):
+    """Tile frames into one sprite sheet and write a timing index for hover scrubbing."""
+    tile_h, tile_w = frames[0][2].shape[:2]
+    rows = math.ceil(len(frames) / cols)
+    sheet = np.zeros((rows * tile_h, cols * tile_w, 3), dtype=np.uint8)
+    index = []
+    for i, (idx, t, img) in enumerate(frames):
+        x, y = (i % cols) * tile_w, (i // cols) * tile_h
+        sheet[y:y + img.shape[0], x:x + img.shape[1]] = img[:tile_h, :tile_w]
+        index.append({"frame": idx, "time": round(t, 3), "x": x, "y": y})
+    sprite_path = os.path.join(out_dir, f"sprite.{ext}")
+    cv2.imwrite(sprite_path, sheet)
+    with open(os.path.join(out_dir, "sprite.json"), "w") as f:
+        json.dump({"sprite": os.path.basename(sprite_path), "tile": [tile_w, tile_h],
+                   "cols": cols, "rows": rows, "frames": index}, f, indent=2)
+    return sprite_path
+
+
+def output_dirs(videos, out_root):
+    """{video: out_root/<path relative to the videos' common folder, without extension>}.
+
+    Many videos share a file name (every object has a concat.mp4), so the folder keeps
+    the relative path; two videos that would still land in one folder raise ValueError.
+    """
+    videos = list(dict.fromkeys(videos))
+    if not videos:
+        return {}
+    root = os.path.commonpath([os.path.dirname(os.path.abspath(v)) for v in videos])
+    dirs = {v: os.path.join(out_root, os.path.splitext(os.path.relpath(os.path.abspath(v), root))[0])
+            for v in videos}
+    seen = {}
+    for video, out_dir in dirs.items():
+        if out_dir in seen:
+            raise ValueError(f"'{seen[out_dir]}' and '{video}' would both be extracted to '{out_dir}'")
+        seen[out_dir] = video
+    return dirs
+
+
+def extract_batch(videos, out_root, count=8, mode="even", width=None, ext="jpg", sprite=False,
+                  sprite_cols=4, workers=8):
+    """Extract frames (and optionally sprites) for many videos in parallel; returns {video: out_dir}."""
+    dirs = output_dirs(videos, out_root)  # fails before any work starts
+
+    def one(video):
+        out_dir = dirs[video]
+        frames = extract_frames(video, out_dir, count=count, mode=mode, width=width, ext=ext)
+        if not frames:
+            raise RuntimeError("no frames could be read")
+        if sprite:
+            write_sprite(frames, out_dir, cols=sprite_cols, ext=ext)
+        return out_dir, len(frames)
+
+    done = {}
+    # OpenCV releases the GIL while decoding, so threads are enough
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {video: pool.submit(one, video) for video in dirs}
+        for video, fut in futures.items():
+            try:
+                out_dir, n = fut.result()
+            except RuntimeError as e:
+                print(f"Error: {video}: {e}")
+                continue
+            done[video] = out_dir
+            print(f"Extracted {n} frames from '{video}' to '{out_dir}'{' (+ sprite)' if sprite else ''}")
+    return done
+
+
+def cli(argv=None):
+    parser = argparse.ArgumentParser(description="Extract the first frame from a video, or preview frames from many.")
+    parser.add_argument("video_path", type=str, nargs="?", help="Path to the input video file.")
+    parser.add_argument("output_path", type=str, nargs="?", help="Path to save the output PNG image.")
+    parser.add_argument("--videos", nargs="+", default=None,
+                        help="Batch mode: video paths or glob patterns (quote globs)")
+    parser.add_argument("--out_dir", default="frames", help="Batch output root; one folder per video, mirroring its path below the common folder")
+    parser.add_argument("--count", type=int, default=8, help="Frames per video")
+    parser.add_argument("--mode", choices=["even", "keyframe"], default="even",
+                        help="Evenly spaced frames, or the nearest keyframes (cheapest to seek to)")
+    parser.add_argument("--width", type=int, default=None, help="Resize extracted frames to this width")
+    parser.add_argument("--ext", default="jpg", help="Image format of extracted frames")
+    parser.add_argument("--sprite", action="store_true", help="Also write sprite.<ext> + sprite.json per video")
+    parser.add_argument("--sprite_cols", type=int, default=4, help="Tiles per sprite row")
+    parser.add_argument("--workers", type=int, default=8, help="Videos processed in parallel")
+    args = parser.parse_args(argv)
+
+    if args.videos:
+        paths = []
+        for pattern in args.videos:
+            paths.extend(sorted(glob.glob(pattern)) or [pattern])
+        try:
+            extract_batch(paths, args.out_dir, count=args.count, mode=args.mode, width=args.width, ext=args.ext,
+                          sprite=args.sprite, sprite_cols=args.sprite_cols, workers=args.workers)
+        except ValueError as e:
+            parser.error(str(e))
+    elif args.video_path and args.output_path:
+        extract_first_frame(args.video_path, args.output_path)
+    else:
+        parser.error("give video_path and output_path, or --videos for batch mode")
+
+
+if __name__ == "__main__":
+    cli()
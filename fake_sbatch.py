@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+fake_sbatch.py ─ Local stand-in for Slurm's sbatch, for testing submissions offline.
+- Runs the --wrap command through /bin/sh as a subprocess, right away.
+- Supports --array (all tasks run concurrently, SLURM_ARRAY_TASK_ID set per task),
+  --dependency=afterok:<id>[:<id>...], --output patterns (%j %A %a %x) and --parsable.
+- Keeps job states in $FAKE_SLURM_DIR (default .fake_slurm) so later submissions can
+  depend on earlier ones; a job whose afterok dependency failed is never run.
+
+Usage: python make_realworld_web_viz.py --slurm --sbatch ./fake_sbatch.py
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+STATE_DIR = os.environ.get("FAKE_SLURM_DIR", ".fake_slurm")
+
+
+def parse_array(spec):
+    """'0-4', '1,3,5' or '0-9%2' → list of task ids (the throttle is ignored)."""
+    spec = spec.split("%")[0]
+    ids = []
+    for part in spec.split(","):
+        if "-" in part:
+            lo, hi = part.split("-")
+            ids.extend(range(int(lo), int(hi) + 1))
+        else:
+            ids.append(int(part))
+    return ids
+
+
+def next_job_id():
+    os.makedirs(STATE_DIR, exist_ok=True)
+    counter = os.path.join(STATE_DIR, "next_id")
+    job_id = int(open(counter).read()) if os.path.exists(counter) else 1000
+    with open(counter, "w") as f:
+        f.write(str(job_id + 1))
+    return job_id
+
+
+def job_state(job_id):
+    path = os.path.join(STATE_DIR, f"{job_id}.json")
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)["state"]
+
+
+def dependencies_ok(spec):
+    """True when every afterok dependency completed successfully."""
+    for dep in spec.split(","):
+        kind, _, ids = dep.partition(":")
+        if kind != "afterok":
+            print(f"[fake_sbatch] unsupported dependency type '{kind}', treating as satisfied", file=sys.stderr)
+            continue
+        if any(job_state(j) != "COMPLETED" for j in ids.split(":")):
+            return False
+    return True
+
+
+def main():
+    p = argparse.ArgumentParser(description="Run an sbatch submission locally.")
+    p.add_argument("--wrap", required=True)
+    p.add_argument("--job-name", default="wrap")
+    p.add_argument("--output", default=None)
+    p.add_argument("--array", default=None)
+    p.add_argument("--dependency", default=None)
+    p.add_argument("--cpus-per-task", default="1")
+    p.add_argument("--parsable", action="store_true")
+    args, _ignored = p.parse_known_args()  # --time, --partition, --gpus, ... have no local meaning
+
+    job_id = next_job_id()
+    tasks = parse_array(args.array) if args.array else [None]
+    record = {"id": job_id, "name": args.job_name, "command": args.wrap, "tasks": {}}
+
+    if args.dependency and not dependencies_ok(args.dependency):
+        record["state"] = "CANCELLED"
+        record["reason"] = "DependencyNeverSatisfied"
+    else:
+        procs = []
+        for task in tasks:
+            pattern = args.output or ("slurm-%A_%a.out" if task is not None else "slurm-%j.out")
+            log_path = (pattern.replace("%A", str(job_id)).replace("%a", str(task))
+                        .replace("%j", str(job_id)).replace("%x", args.job_name))
+            if os.path.dirname(log_path):
+                os.makedirs(os.path.dirname(log_path), exist_ok=True)
+            env = dict(os.environ, SLURM_JOB_ID=str(job_id), SLURM_JOB_NAME=args.job_name,
+                       SLURM_CPUS_PER_TASK=str(args.cpus_per_task))
+            if task is not None:
+                env.update(SLURM_ARRAY_JOB_ID=str(job_id), SLURM_ARRAY_TASK_ID=str(task))
+            log = open(log_path, "w")
+            procs.append((task, log, subprocess.Popen(["/bin/sh", "-c", args.wrap], env=env,
+                                                      stdout=log, stderr=subprocess.STDOUT)))
+        for task, log, proc in procs:
+            record["tasks"][str(task)] = proc.wait()
+            log.close()
+        ok = all(code == 0 for code in record["tasks"].values())
+        record["state"] = "COMPLETED" if ok else "FAILED"
+
+    with open(os.path.join(STATE_DIR, f"{job_id}.json"), "w") as f:
+        json.dump(record, f, indent=2)
+    if record["state"] != "COMPLETED":
+        print(f"[fake_sbatch] job {job_id} ({args.job_name}) {record['state']}", file=sys.stderr)
+    print(job_id if args.parsable else f"Submitted batch job {job_id}")
+
+
+if __name__ == "__main__":
+    main()
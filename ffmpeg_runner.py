@@ -0,0 +1,219 @@
+"""
+ffmpeg_runner.py ─ Structured ffmpeg invocations for the build scripts.
+- run() starts ffmpeg from an argv list (no shell, so paths need no quoting) and
+  raises FFmpegError with the tail of stderr on a non-zero exit; pipe() does the same
+  for an ffmpeg fed raw frames on stdin.
+- `-progress` output is parsed into per-job frame counts, fps and ETA, printed
+  every PROGRESS_EVERY_S seconds.
+- At most `max_jobs` ffmpeg processes run at once across all threads (default:
+  one per ENCODE_THREADS cores); run_all() starts a batch of jobs within that cap.
+- atomic_output() and publish() make files appear at their final path in one
+  rename, so a page (or a later stage) never sees a half-written video.
+"""
+
+import os
+import shlex
+import shutil
+import subprocess
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+ENCODE_THREADS = 4       # cores one libx264 encode keeps reasonably busy
+PROGRESS_EVERY_S = 5.0
+STDERR_TAIL = 20         # stderr lines kept for the error message
+
+
+def default_max_jobs():
+    return max(1, (os.cpu_count() or 1) // ENCODE_THREADS)
+
+
+_slots = threading.BoundedSemaphore(default_max_jobs())
+
+
+class FFmpegError(RuntimeError):
+    """ffmpeg exited with a non-zero status."""
+
+    def __init__(self, name, returncode, stderr_tail):
+        self.name = name
+        self.returncode = returncode
+        self.stderr_tail = stderr_tail
+        super().__init__(f"ffmpeg failed with exit code {returncode} ({name})" +
+                         ("\n" + "\n".join(stderr_tail) if stderr_tail else ""))
+
+
+def configure(max_jobs: int = None):
+    """Cap the number of concurrent ffmpeg processes (None: one per ENCODE_THREADS cores)."""
+    global _slots
+    _slots = threading.BoundedSemaphore(max(1, max_jobs or default_max_jobs()))
+
+
+def _progress_line(name, stats, total_frames, elapsed):
+    frame = int(stats.get("frame", 0) or 0)
+    try:
+        fps = float(stats.get("fps", 0) or 0)
+    except ValueError:  # "N/A" before the first frame
+        fps = 0.0
+    fps = fps or (frame / elapsed if elapsed > 0 else 0.0)
+    done = f"frame {frame}"
+    eta = ""
+    if total_frames:
+        done += f"/{total_frames} ({100 * frame / total_frames:.0f}%)"
+        if fps > 0 and frame < total_frames:
+            eta = f", ETA {(total_frames - frame) / fps:.0f}s"
+    return f"[ffmpeg] {name}: {done}, {fps:.1f} fps{eta}"
+
+
+def _popen(cmd, name, stdin):
+    """Start ffmpeg reporting -progress on stdout; returns (proc, stderr tail, drain thread)."""
+    argv = [cmd[0], "-hide_banner", "-nostats", "-progress", "pipe:1", *cmd[1:]]
+    print(f"[exec] {name}: {shlex.join(cmd)}")
+    proc = subprocess.Popen(argv, stdin=stdin, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    tail = deque(maxlen=STDERR_TAIL)
+    drain = threading.Thread(target=lambda: tail.extend(line.decode(errors="replace").rstrip()
+                                                        for line in proc.stderr), daemon=True)
+    drain.start()
+    return proc, tail, drain
+
+
+def _follow_progress(proc, name, total_frames, t0, stats):
+    """Collect -progress key=value pairs into *stats*, printing a line every PROGRESS_EVERY_S."""
+    last = t0
+    for line in proc.stdout:
+        key, _, value = line.decode(errors="replace").strip().partition("=")
+        stats[key] = value
+        now = time.perf_counter()
+        if (key == "progress" and value != "end" and now - last >= PROGRESS_EVERY_S
+                and stats.get("frame", "0") != "0"):
+            print(_progress_line(name, stats, total_frames, now - t0))
+            last = now
+
+
+def _result(name, code, tail, stats, t0):
+    wall = time.perf_counter() - t0
+    if code != 0:
+        raise FFmpegError(name, code, list(tail))
+    frames = int(stats.get("frame", 0) or 0)
+    print(f"✅ {name}: {frames} frames in {wall:.1f}s ({frames / wall if wall > 0 else 0:.1f} fps)")
+    return {"frames": frames, "fps": frames / wall if wall > 0 else 0.0, "wall_s": wall}
+
+
+def run(cmd, name: str = None, total_frames: int = None):
+    """Run one ffmpeg argv list, waiting for a free slot first.
+
+    *total_frames* (when known) turns the progress report into a percentage and ETA.
+    Returns {"frames", "fps", "wall_s"}; raises FFmpegError on failure.
+    """
+    cmd = [str(c) for c in cmd]
+    name = name or os.path.basename(cmd[-1])
+    with _slots:
+        t0 = time.perf_counter()
+        proc, tail, drain = _popen(cmd, name, subprocess.DEVNULL)
+        stats = {}
+        try:
+            _follow_progress(proc, name, total_frames, t0, stats)
+            code = proc.wait()
+        finally:
+            if proc.poll() is None:  # e.g. Ctrl-C while reading progress
+                proc.terminate()
+                proc.wait()
+        drain.join()
+    return _result(name, code, tail, stats, t0)
+
+
+@contextmanager
+def pipe(cmd, name: str = None, total_frames: int = None):
+    """run() for an ffmpeg that reads its input from stdin ("-i -"): yields the binary stdin.
+
+    The slot is held for the whole block. On leaving it, stdin is closed and ffmpeg
+    awaited; a non-zero exit raises FFmpegError, as does ffmpeg quitting before it read
+    everything (which the block sees as BrokenPipeError). If the block raises, ffmpeg
+    is terminated.
+    """
+    cmd = [str(c) for c in cmd]
+    name = name or os.path.basename(cmd[-1])
+    with _slots:
+        t0 = time.perf_counter()
+        proc, tail, drain = _popen(cmd, name, subprocess.PIPE)
+        stats = {}
+        follow = threading.Thread(target=_follow_progress, args=(proc, name, total_frames, t0, stats), daemon=True)
+        follow.start()
+        broken = False
+        try:
+            try:
+                yield proc.stdin
+            except BrokenPipeError:
+                broken = True
+            try:
+                proc.stdin.close()
+            except BrokenPipeError:
+                broken = True
+            code = proc.wait()
+        finally:
+            if proc.poll() is None:
+                proc.terminate()
+                proc.wait()
+            follow.join()
+            drain.join()
+    if broken and code == 0:
+        raise FFmpegError(name, code, [*tail, "ffmpeg exited before reading all of its input"])
+    _result(name, code, tail, stats, t0)
+
+
+def run_all(jobs):
+    """Run several jobs (dicts of run() keyword arguments) concurrently within the slot cap.
+
+    Every job runs to completion; the first failure is raised afterwards.
+    """
+    if not jobs:
+        return []
+    with ThreadPoolExecutor(max_workers=len(jobs)) as pool:
+        futures = [pool.submit(run, **job) for job in jobs]
+    errors = [f.exception() for f in futures if f.exception() is not None]
+    if errors:
+        for err in errors[1:]:
+            print(f"❌ {err}")
+        raise errors[0]
+    return [f.result() for f in futures]
+
+
+# -----------------------------------------------------------------------------
+# Atomic outputs
+# -----------------------------------------------------------------------------
+
+
+def _tmp_path(path):
+    # Keep the extension: ffmpeg picks the output format from it
+    root, ext = os.path.splitext(str(path))
+    return f"{root}.part-{os.getpid()}-{threading.get_ident()}{ext}"
+
+
+@contextmanager
+def atomic_output(path):
+    """Yield a temporary path next to *path*; rename it into place if the block succeeds.
+
+    Also gives the result a new inode, so hard links published from an older
+    version of *path* keep pointing at the old file instead of being rewritten.
+    """
+    tmp = _tmp_path(path)
+    try:
+        yield tmp
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def publish(src, dst):
+    """Atomically make *dst* a hard link to *src*, or a copy when the two are on different
+    filesystems. Returns "linked" or "copied"."""
+    with atomic_output(dst) as tmp:
+        try:
+            os.link(src, tmp)
+            how = "linked"
+        except OSError:
+            shutil.copy2(src, tmp)
+            how = "copied"
+    return how
@@ -0,0 +1,122 @@
+"""
+frame_pipeline.py ─ Three-stage threaded decode → composite → encode pipeline.
+- Each stage runs in its own thread; stages are connected by bounded queues (backpressure).
+- Frame order is preserved (one thread per stage, FIFO queues).
+- The first exception in any stage stops all stages and is re-raised to the caller.
+
+OpenCV, NumPy and the ffmpeg writers release the GIL in their heavy calls, so wall
+time approaches that of the slowest stage instead of the sum of all three.
+"""
+
+import queue
+import threading
+
+import numpy as np
+
+
+_DONE = object()
+
+
+class BufferRing:
+    """Round-robin pool of preallocated frames for stages that write into reused buffers.
+
+    A buffer may still be queued downstream, so the ring must be larger than the number
+    of frames that can be in flight after the producing stage (queue size + 2).
+    """
+
+    def __init__(self, shape, count, dtype=np.uint8):
+        self._bufs = [np.empty(shape, dtype=dtype) for _ in range(count)]
+        self._i = 0
+
+    def next(self) -> np.ndarray:
+        buf = self._bufs[self._i]
+        self._i = (self._i + 1) % len(self._bufs)
+        return buf
+
+
+class _Stop(Exception):
+    pass
+
+
+def run_pipeline(source, transform, sink, maxsize: int = 8):
+    """Run `sink(transform(item))` for every item of `source`, each part in its own thread.
+
+    source:    iterable producing decoded items (iterated in the decode thread)
+    transform: item -> item, run in the composite thread
+    sink:      item -> None, run in the encode thread (e.g. writer.append_data)
+    maxsize:   capacity of each inter-stage queue
+    """
+    q_decoded = queue.Queue(maxsize=maxsize)
+    q_composited = queue.Queue(maxsize=maxsize)
+    stop = threading.Event()
+    errors = []
+
+    def put(q, item):
+        # Poll so a blocked producer notices when another stage failed
+        while True:
+            if stop.is_set():
+                raise _Stop()
+            try:
+                q.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def get(q):
+        while True:
+            if stop.is_set():
+                raise _Stop()
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+    def guarded(fn):
+        def run():
+            try:
+                fn()
+            except _Stop:
+                pass
+            except BaseException as e:
+                errors.append(e)
+                stop.set()
+        return run
+
+    def decode():
+        for item in source:
+            put(q_decoded, item)
+        put(q_decoded, _DONE)
+
+    def composite():
+        while True:
+            item = get(q_decoded)
+            if item is _DONE:
+                put(q_composited, _DONE)
+                return
+            put(q_composited, transform(item))
+
+    def encode():
+        while True:
+            item = get(q_composited)
+            if item is _DONE:
+                return
+            sink(item)
+
+    threads = [
+        threading.Thread(target=guarded(decode), name="decode", daemon=True),
+        threading.Thread(target=guarded(composite), name="composite", daemon=True),
+        threading.Thread(target=guarded(encode), name="encode", daemon=True),
+    ]
+    for t in threads:
+        t.start()
+    try:
+        for t in threads:
+            t.join()
+    except BaseException:
+        # e.g. KeyboardInterrupt in the caller: shut the stages down before propagating
+        stop.set()
+        for t in threads:
+            t.join()
+        raise
+    if errors:
+        raise errors[0]
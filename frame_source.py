@@ -0,0 +1,262 @@
+"""
+frame_source.py ─ Looping, memory-bounded access to the frames of a video.
+- Decodes the clip once, keeping frames in RAM while they fit in a byte budget.
+- Spills to an on-disk frame file once the budget is exceeded.
+- Serves frames[idx % total_frames] so callers can loop the clip freely.
+- With a known frame count, decodes on demand so decoding overlaps consumption.
+- SeekingFrameReader reads a stretch of a clip of known length after a single seek.
+- iter_split_frames() has ffmpeg crop two half-panes at decode time and streams
+  only those bytes through a rawvideo pipe.
+"""
+
+import os
+import subprocess
+import tempfile
+
+import cv2
+import numpy as np
+
+from media_trace import stage
+
+
+DEFAULT_CACHE_MB = 512
+
+
+class LoopingFrameSource:
+    """Random-access view over the decoded BGR frames of a video, looping at the end.
+
+    Frames are decoded lazily the first time the source is touched. Up to
+    `cache_mb` megabytes of frames are kept in memory; longer clips are spilled
+    to a temporary raw frame file and read back one frame at a time, so peak
+    RSS stays bounded no matter how long the clip is.
+
+    When the frame count is known up front (see `probe_frame_count`), frames are
+    decoded on demand as they are first requested instead of all at once, so
+    decoding overlaps with whatever consumes the frames. The count is only a hint:
+    decoding stops at the end of the stream, and if that comes early the clip
+    loops over the frames that were actually decoded.
+    """
+
+    def __init__(self, path: str, cache_mb: float = DEFAULT_CACHE_MB, spill_dir: str = None,
+                 frame_count: int = None):
+        self.path = path
+        self.cache_bytes = int(cache_mb * 1024 * 1024)
+        self.spill_dir = spill_dir
+
+        cap = cv2.VideoCapture(path)
+        if not cap.isOpened():
+            raise RuntimeError(f"Cannot open {path}")
+        self.width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        self.fps = cap.get(cv2.CAP_PROP_FPS)
+        cap.release()
+
+        self._cap = None      # capture kept open while decoding is in progress
+        self._frames = []     # in-memory frames (list of arrays), None once spilled
+        self._spill = None    # open file object of the on-disk spill
+        self._spill_path = None
+        self._used = 0
+        self._decoded = 0
+        self._total = frame_count  # known length; None until decoding finishes
+        self._complete = False
+        self._frame_shape = None
+
+    # ------------------------------------------------------------------ decode
+    def _decode_next(self) -> bool:
+        """Decode and store one more frame; return False at the end of the clip."""
+        if self._cap is None:
+            self._cap = cv2.VideoCapture(self.path)
+            if not self._cap.isOpened():
+                raise RuntimeError(f"Cannot open {self.path}")
+
+        with stage("decode", 1):
+            ret, frame = self._cap.read()
+        if not ret or (self._total is not None and self._decoded >= self._total):
+            self._cap.release()
+            self._cap = None
+            self._complete = True
+            if self._total is not None and self._decoded < self._total:
+                print(f"[WARN] {self.path}: expected {self._total} frames, stream ended after {self._decoded}")
+            self._total = self._decoded
+            return False
+
+        if self._frame_shape is None:
+            self._frame_shape = frame.shape
+        self._decoded += 1
+
+        if self._spill is not None:
+            self._spill.seek(0, os.SEEK_END)
+            self._spill.write(frame.tobytes())
+            return True
+
+        self._frames.append(frame)
+        self._used += frame.nbytes
+        if self._used > self.cache_bytes:
+            # Budget exceeded: move everything decoded so far to disk
+            fd, self._spill_path = tempfile.mkstemp(prefix="frames_", suffix=".raw", dir=self.spill_dir)
+            self._spill = os.fdopen(fd, "w+b")
+            for f in self._frames:
+                self._spill.write(f.tobytes())
+            self._frames = None
+        return True
+
+    def _decode_until(self, count: int):
+        while self._decoded < count and not self._complete:
+            self._decode_next()
+
+    def _ensure_decoded(self):
+        while not self._complete:
+            self._decode_next()
+
+    # ------------------------------------------------------------------ access
+    def __len__(self):
+        if self._total is None:
+            self._ensure_decoded()
+        return self._total
+
+    @property
+    def spilled(self) -> bool:
+        self._ensure_decoded()
+        return self._spill is not None
+
+    def __getitem__(self, idx: int) -> np.ndarray:
+        """Return frame `idx % len(self)` as a BGR uint8 array (do not modify in place)."""
+        total = len(self)
+        if total == 0:
+            raise IndexError(f"No frames found in {self.path}")
+        idx %= total
+        self._decode_until(idx + 1)
+        if idx >= self._decoded:  # the stream ended before the hinted frame count
+            if self._decoded == 0:
+                raise IndexError(f"No frames found in {self.path}")
+            idx %= self._decoded
+
+        if self._frames is not None:
+            return self._frames[idx]
+
+        with stage("spill_read", 1):
+            frame = np.empty(self._frame_shape, dtype=np.uint8)
+            self._spill.seek(idx * frame.nbytes)
+            self._spill.readinto(memoryview(frame).cast("B"))
+        return frame
+
+    # ------------------------------------------------------------------ cleanup
+    def close(self):
+        self._frames = None
+        if self._cap is not None:
+            self._cap.release()
+            self._cap = None
+        if self._spill is not None:
+            self._spill.close()
+            self._spill = None
+        if self._spill_path is not None and os.path.exists(self._spill_path):
+            os.remove(self._spill_path)
+            self._spill_path = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class SeekingFrameReader:
+    """Frames of a clip of known length, read in order and seeking only where the index jumps.
+
+    Meant for rendering one chunk of a longer looped output: reaching the chunk's first
+    frame costs one seek (to the preceding keyframe) instead of decoding from frame 0,
+    and nothing is kept in memory.
+    """
+
+    def __init__(self, path: str, frame_count: int):
+        self.path = path
+        self._cap = cv2.VideoCapture(path)
+        if not self._cap.isOpened():
+            raise RuntimeError(f"Cannot open {path}")
+        self.fps = self._cap.get(cv2.CAP_PROP_FPS)
+        self._total = frame_count
+        self._pos = 0  # index of the frame the next read() returns
+
+    def __len__(self):
+        return self._total
+
+    def __getitem__(self, idx: int) -> np.ndarray:
+        idx %= self._total
+        if idx != self._pos:
+            self._cap.set(cv2.CAP_PROP_POS_FRAMES, idx)
+        with stage("decode", 1):
+            ret, frame = self._cap.read()
+        if not ret:
+            raise RuntimeError(f"{self.path}: cannot read frame {idx} of {self._total}")
+        self._pos = idx + 1
+        return frame
+
+    def close(self):
+        self._cap.release()
+
+
+def probe_frame_count(path: str):
+    """Exact frame count from ffprobe's packet count, or None when ffprobe is unavailable."""
+    from analyze_video_dims import probe_video
+
+    info = probe_video(path)
+    if info is None or info["source"] != "ffprobe" or info["frame_count"] <= 0:
+        return None
+    return info["frame_count"]
+
+
+def _ffmpeg_frames(cmd, shape, count):
+    """Read `count` raw BGR frames of `shape` from an ffmpeg rawvideo pipe."""
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    try:
+        for _ in range(count):
+            frame = np.empty(shape, dtype=np.uint8)
+            with stage("decode", 1):
+                n = proc.stdout.readinto(memoryview(frame).cast("B"))
+            if n != frame.nbytes:
+                proc.wait()
+                raise RuntimeError(f"ffmpeg ended early: {proc.stderr.read().decode(errors='replace').strip()}")
+            yield frame
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+        proc.stdout.close()
+        proc.stderr.close()
+        proc.wait()
+
+
+def iter_split_frames(path, pane_w, height, left_pane, right_pane, start, count, total, fps):
+    """Yield `count` frames of [left half of `left_pane` | right half of `right_pane`].
+
+    Frames start at source frame `start` and loop over the `total`-frame clip. The
+    crop happens inside ffmpeg, so only the two half-panes are converted to BGR and
+    copied through the pipe; every yielded frame is a new (height, pane_w, 3) array.
+    """
+    half = pane_w // 2
+    graph = (f"[0:v]crop={half}:{height}:{left_pane * pane_w}:0[l];"
+             f"[0:v]crop={pane_w - half}:{height}:{right_pane * pane_w + half}:0[r];[l][r]hstack")
+    shape = (height, pane_w, 3)
+
+    def cmd(pre, n):
+        return ["ffmpeg", "-v", "error", *pre, "-i", path, "-filter_complex", graph,
+                "-frames:v", str(n), "-fps_mode", "passthrough", "-f", "rawvideo", "-pix_fmt", "bgr24", "-"]
+
+    # -ss and -stream_loop don't combine (later loops restart near the seek point), so
+    # read from `start` to the end of the clip first, then loop from frame 0.
+    start %= total
+    first = min(count, total - start)
+    # Half a frame early so rounding can't skip the start frame (accurate seek drops earlier
+    # ones); passthrough keeps ffmpeg from duplicating frames to fill the half-frame gap
+    seek = ["-ss", f"{(start - 0.5) / fps:.6f}"] if start > 0 else []
+    yield from _ffmpeg_frames(cmd(seek, first), shape, first)
+
+    rest = count - first
+    if rest > 0:
+        loops = (rest - 1) // total  # extra passes beyond the first
+        yield from _ffmpeg_frames(cmd(["-stream_loop", str(loops)], rest), shape, rest)
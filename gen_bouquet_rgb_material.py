@@ -1,6 +1,13 @@
 import cv2
-import os
 import argparse
+import numpy as np
+
+from build_cache import BuildCache
+from frame_pipeline import run_pipeline
+from frame_source import LoopingFrameSource, DEFAULT_CACHE_MB, probe_frame_count
+import media_trace
+from media_trace import stage
+import video_writer
 
 def put_text(img, text, org, font_scale, thickness, align_right=False):
     """Utility to draw text with a shadow for better readability."""
@@ -17,37 +24,40 @@ def put_text(img, text, org, font_scale, thickness, align_right=False):
     # Text
     cv2.putText(img, text, (x, y), font, font_scale, (255, 255, 255), thickness, cv2.LINE_AA)
 
-def main(inp_path: str, out_path: str, scene_name: str = "Bouquet", pane_count: int = 5, repeat: int = 2):
-    cap = cv2.VideoCapture(inp_path)
-    if not cap.isOpened():
-        raise RuntimeError(f"Cannot open {inp_path}")
-
-    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-    fps = cap.get(cv2.CAP_PROP_FPS)
+def main(inp_path: str, out_path: str, scene_name: str = "Bouquet", pane_count: int = 5, repeat: int = 2,
+         cache_mb: float = DEFAULT_CACHE_MB, force: bool = False, pipeline: bool = False, queue_size: int = 8,
+         transition: str = "cut", transition_sec: float = 0.5, backend: str = "auto", crf: int = 18):
+    # Skip the render when the input clip and labelling parameters are unchanged
+    cache = BuildCache(force=force)
+    backend, encoder = video_writer.resolve(backend, crf=crf)
+    key = cache.key([inp_path], {"scene": scene_name, "pane_count": pane_count, "repeat": repeat,
+                               "transition": transition, "transition_sec": transition_sec,
+                               "backend": backend, "encoder": encoder})
+    if cache.is_fresh(f"split:{out_path}", key, [out_path]):
+        print(f"[cache] {out_path} is up to date")
+        return
+
+    # Frames are decoded lazily and looped from a bounded cache (spilling to disk for long clips)
+    # In pipelined mode a known frame count lets decoding run alongside compositing and encoding
+    frame_count = probe_frame_count(inp_path) if pipeline else None
+    frames = LoopingFrameSource(inp_path, cache_mb=cache_mb, frame_count=frame_count)
+    len(frames)  # without a known count, decode up front so the decode stage is timed on its own
+
+    width = frames.width
+    height = frames.height
+    fps = frames.fps
     # fps = 30.0
     # fps = 15.0
     # if fps <= 1e-2:
     #     fps = 30.0  # fallback default FPS when metadata missing
 
-    # Load all frames once so we can easily re-index when repeating segments
-    frames = []
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
-        frames.append(frame)
-    cap.release()
-
     pane_w = width // pane_count
     rgb_x0, rgb_x1 = 0, pane_w
     mat_x0, mat_x1 = pane_w, 2 * pane_w
 
     out_h, out_w = height, pane_w
     half = pane_w // 2  # middle x coordinate for split
-    fourcc = cv2.VideoWriter_fourcc(*"mp4v")
-    os.makedirs(os.path.dirname(out_path), exist_ok=True)
-    writer = cv2.VideoWriter(out_path, fourcc, fps, (out_w, out_h))
+    writer = video_writer.open_writer(out_path, (out_w, out_h), fps, backend, **encoder)
     
     font_scale = out_h / 540 * 0.9
     thickness = 2
@@ -65,72 +75,111 @@ def main(inp_path: str, out_path: str, scene_name: str = "Bouquet", pane_count:
     # Effective frames after looping the entire video `repeat` times
     effective_total_frames = total_frames * repeat
     seg_len = effective_total_frames // len(feature_list)  # longer segment per feature
-    # fade_frames = min(int(0.1 * seg_len), seg_len // 3)
-    fade_frames = 0
     total_output_frames = effective_total_frames
 
+    # Transition into each feature over the first `fade_frames` frames of its segment.
+    # Step k uses weight ramp[k]/256 for the incoming feature (uint16 fixed point) or,
+    # for wipes, shows the incoming feature left of column wipe_x[k] of the right half.
+    fade_frames = 0 if transition == "cut" else min(int(round(transition_sec * fps)), seg_len // 2)
+    right_w = pane_w - half
+    steps = np.arange(1, fade_frames + 1) / (fade_frames + 1)
+    ramp = np.round(steps * 256).astype(np.uint16)
+    wipe_x = np.round(steps * right_w).astype(np.int64)
+    acc = np.empty((out_h, right_w, 3), dtype=np.uint16)
+    tmp = np.empty_like(acc)
+
     # Pre-compute text height using generic label
     (_, text_h), _ = cv2.getTextSize("RGB", cv2.FONT_HERSHEY_DUPLEX, font_scale, thickness)
 
-    out_frame_count = 0
-    for idx in range(total_output_frames):
-        # Select the frame from the original clip, looping when we reach the end
-        frame = frames[idx % total_frames]
-
-        seg_idx = idx // seg_len  # which feature we are on (0-based)
-        in_seg_frame = idx % seg_len
-
-        rgb = frame[:, rgb_x0:rgb_x1]
-
-        curr_pane_idx, curr_label = feature_list[seg_idx]
-
-        # Determine previous feature for fading
-        prev_pane_idx, prev_label = feature_list[seg_idx - 1] if seg_idx > 0 else (curr_pane_idx, curr_label)
-
-        curr_x0, curr_x1 = curr_pane_idx * pane_w, (curr_pane_idx + 1) * pane_w
-        prev_x0, prev_x1 = prev_pane_idx * pane_w, (prev_pane_idx + 1) * pane_w
-
-        curr_feat = frame[:, curr_x0:curr_x1]
-        prev_feat = frame[:, prev_x0:prev_x1]
-
-        # Alpha for fade
-        # `in_seg_frame` already computed above
-        if fade_frames > 0 and in_seg_frame < fade_frames and seg_idx > 0:
-            alpha = in_seg_frame / fade_frames
-            right_half = cv2.addWeighted(prev_feat[:, half:], 1 - alpha, curr_feat[:, half:], alpha, 0)
-            right_label = curr_label if alpha > 0.5 else prev_label
-        elif fade_frames > 0 and in_seg_frame > seg_len - fade_frames and seg_idx < len(feature_list) - 1:
-            alpha = (seg_len - in_seg_frame) / fade_frames
-            next_pane_idx, next_label = feature_list[seg_idx + 1]
-            next_x0, next_x1 = next_pane_idx * pane_w, (next_pane_idx + 1) * pane_w
-            next_feat = frame[:, next_x0:next_x1]
-            right_half = cv2.addWeighted(curr_feat[:, half:], alpha, next_feat[:, half:], 1 - alpha, 0)
-            right_label = curr_label if alpha >= 0.5 else next_label
-        else:
-            right_half = curr_feat[:, half:]
-            right_label = curr_label
-
-        comp = rgb.copy()
-        comp[:, half:] = right_half
-
-        cv2.line(comp, (half, 0), (half, out_h), (255, 255, 255), 4)
-
-        # Draw labels
-        put_text(comp, "RGB", (margin, margin + text_h), font_scale, thickness)
-        put_text(comp, right_label, (out_w - margin, margin + text_h), font_scale, thickness, align_right=True)
-        put_text(comp, scene_name, (margin, out_h - margin), font_scale, thickness)
+    def pane(frame, pane_idx):
+        return frame[:, pane_idx * pane_w + half:(pane_idx + 1) * pane_w]  # right half only
+
+    def render(item):
+        idx, frame = item
+        with stage("composite", 1):
+            seg_idx = idx // seg_len  # which feature we are on (0-based)
+            in_seg_frame = idx % seg_len
+
+            curr_pane_idx, right_label = feature_list[seg_idx]
+            comp = frame[:, rgb_x0:rgb_x1].copy()
+            right = comp[:, half:]
+
+            if seg_idx > 0 and in_seg_frame < fade_frames:
+                prev_pane_idx, prev_label = feature_list[seg_idx - 1]
+                curr, prev = pane(frame, curr_pane_idx), pane(frame, prev_pane_idx)
+                if transition == "crossfade":
+                    w = ramp[in_seg_frame]
+                    np.multiply(curr, w, out=acc)
+                    np.multiply(prev, np.uint16(256) - w, out=tmp)
+                    np.add(acc, tmp, out=acc)
+                    np.add(acc, np.uint16(128), out=acc)  # round to nearest on the >> 8
+                    np.right_shift(acc, 8, out=acc)
+                    right[...] = acc
+                    if w < 128:
+                        right_label = prev_label
+                else:  # wipe
+                    x = wipe_x[in_seg_frame]
+                    right[:, :x] = curr[:, :x]
+                    right[:, x:] = prev[:, x:]
+                    if 2 * x < right_w:
+                        right_label = prev_label
+            else:
+                right[...] = pane(frame, curr_pane_idx)
+
+        with stage("text", 1):
+            cv2.line(comp, (half, 0), (half, out_h), (255, 255, 255), 4)
+
+            # Draw labels
+            put_text(comp, "RGB", (margin, margin + text_h), font_scale, thickness)
+            put_text(comp, right_label, (out_w - margin, margin + text_h), font_scale, thickness, align_right=True)
+            put_text(comp, scene_name, (margin, out_h - margin), font_scale, thickness)
         
-        writer.write(comp)
-
-    writer.release()
-    cap.release()
+        return comp
+
+    def write(comp):
+        with stage("encode", 1):
+            writer.write(comp)
+
+    # Select the frame from the original clip, looping when we reach the end
+    decoded = ((idx, frames[idx % total_frames]) for idx in range(total_output_frames))
+    if pipeline:
+        run_pipeline(decoded, render, write, maxsize=queue_size)
+    else:
+        for item in decoded:
+            write(render(item))
+
+    with stage("encode"):
+        writer.close()
+    frames.close()
+    cache.record(f"split:{out_path}", key, [out_path])
     print(f"Wrote {out_path}")
 
-if __name__ == "__main__":
+def cli(argv=None):
     parser = argparse.ArgumentParser(description="Generate split RGB | feature video with labels.")
     parser.add_argument("--inp", default="static/videos/ours_real_world/renders/bouquet/concat.mp4", help="Path to concat video")
     parser.add_argument("--out", default="static/videos/ours_real_world/bouquet_rgb_mat.mp4", help="Output mp4 path")
     parser.add_argument("--scene", default="Bouquet", help="Scene name label")
     parser.add_argument("--repeat", type=int, default=2, help="How many times to repeat each feature segment")
-    args = parser.parse_args()
-    main(args.inp, args.out, args.scene, repeat=args.repeat) 
\ No newline at end of file
+    parser.add_argument("--cache_mb", type=float, default=DEFAULT_CACHE_MB,
+                        help="In-memory frame budget (MB) before spilling decoded frames to disk")
+    parser.add_argument("--force", action="store_true", help="Ignore the build cache and always re-render")
+    parser.add_argument("--transition", choices=["cut", "crossfade", "wipe"], default="cut",
+                        help="How the right pane switches between features")
+    parser.add_argument("--transition_sec", type=float, default=0.5, help="Length of each crossfade/wipe")
+    parser.add_argument("--backend", choices=["auto", *video_writer.BACKENDS], default="auto",
+                        help="Video writer backend (auto: the one picked by `python video_writer.py`)")
+    parser.add_argument("--crf", type=int, default=18, help="Encoder quality (ffmpeg/imageio backends)")
+    parser.add_argument("--pipeline", action="store_true",
+                        help="Run decode, compositing and encoding in separate threads")
+    parser.add_argument("--queue_size", type=int, default=8, help="Frames buffered between pipeline stages")
+    parser.add_argument("--trace", default=None, help="Write per-stage timings (Chrome trace JSON) to this path")
+    args = parser.parse_args(argv)
+    if args.trace:
+        media_trace.enable(args.trace)
+    main(args.inp, args.out, args.scene, repeat=args.repeat, cache_mb=args.cache_mb, force=args.force,
+         pipeline=args.pipeline, queue_size=args.queue_size,
+         transition=args.transition, transition_sec=args.transition_sec, backend=args.backend, crf=args.crf)
+
+
+if __name__ == "__main__":
+    cli()
@@ -1,9 +1,22 @@
 # Standard video and image processing
+import argparse
 import cv2
 import os
-
-# Use imageio's FFmpeg writer for reliable MP4 output
-import imageio.v2 as imageio
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+from build_cache import BuildCache
+from compositor import SplitCompositor
+import crf_search
+import ffmpeg_runner
+from ffmpeg_runner import atomic_output
+from frame_pipeline import BufferRing, run_pipeline
+from frame_source import (DEFAULT_CACHE_MB, LoopingFrameSource, SeekingFrameReader, iter_split_frames,
+                          probe_frame_count)
+import media_trace
+from media_trace import stage
+import video_writer
 
 FEATURES = [
     (1, "Material"),
@@ -26,38 +39,69 @@ repeats = {
 
 OUTPUT = "static/videos/ours_real_world/real_demo_combined.mp4"
 FPS = 30
+ENCODER_OPTIONS = {"bitrate": "8M"}
 
 
-def put_text(img, text, org, font_scale, thickness, align_right=False):
-    font = cv2.FONT_HERSHEY_DUPLEX
-    (w, _), _ = cv2.getTextSize(text, font, font_scale, thickness)
-    x, y = org
-    if align_right:
-        x -= w
-    cv2.putText(img, text, (x + 2, y + 2), font, font_scale, (0, 0, 0), thickness + 1, cv2.LINE_AA)
-    cv2.putText(img, text, (x, y), font, font_scale, (255, 255, 255), thickness, cv2.LINE_AA)
-
-
-def process_scene(scene_name, writer, writer_size):
-    path = VIDEO_PATHS[scene_name]
+def read_all_frames(path):
+    """(frames, fps) of a whole clip decoded into memory, or (None, 0) if it cannot be opened."""
     cap = cv2.VideoCapture(path)
     if not cap.isOpened():
-        print(f"Cannot open {path}")
-        return
-
-    # Read all frames into memory so we can loop over them multiple times
+        return None, 0
+    fps = cap.get(cv2.CAP_PROP_FPS)
     frames = []
     while True:
-        ret, frame = cap.read()
+        with stage("decode", 1):
+            ret, frame = cap.read()
         if not ret:
             break
         frames.append(frame)
     cap.release()
+    return frames, fps
+
+
+def process_scene(scene_name, writer, writer_size, pipeline=False, queue_size=8, pane_reader=False,
+                  start=0, stop=None, cache_mb=None, frame_count=None):
+    """Write output frames [start, stop) of a scene to `writer`; return how many were written.
+
+    `frame_count` (the clip's length, when the caller probed it) lets a chunk seek to its
+    first source frame instead of decoding the clip from frame 0.
+    """
+    path = VIDEO_PATHS[scene_name]
+    if frame_count is not None and not pane_reader:
+        try:
+            frames = SeekingFrameReader(path, frame_count)
+        except RuntimeError:
+            print(f"Cannot open {path}")
+            return 0
+        fps = frames.fps
+    elif pipeline or pane_reader or cache_mb is not None:
+        # Frames are looped from a bounded cache; a frame count lets the pipelined mode
+        # decode alongside compositing and encoding instead of all up front
+        if frame_count is None and (pipeline or pane_reader):
+            frame_count = probe_frame_count(path)
+        try:
+            frames = LoopingFrameSource(path, DEFAULT_CACHE_MB if cache_mb is None else cache_mb,
+                                        frame_count=frame_count)
+        except RuntimeError:
+            print(f"Cannot open {path}")
+            return 0
+        fps = frames.fps
+    else:
+        # Read all frames into memory so we can loop over them multiple times
+        frames, fps = read_all_frames(path)
+        if frames is None:
+            print(f"Cannot open {path}")
+            return 0
+
+    # The pane reader seeks by timestamp, so it needs the exact frame count and fps
+    if pane_reader and (frame_count is None or fps <= 0 or shutil.which("ffmpeg") is None):
+        print(f"[WARN] pane reader needs ffmpeg, ffprobe and a known fps; decoding full frames of {path}")
+        pane_reader = False
 
     total_frames = len(frames)
     if total_frames == 0:
         print(f"No frames found in {path}")
-        return
+        return 0
 
     # Determine how many times to loop this clip
     repeat = repeats.get(scene_name, 1)
@@ -66,45 +110,182 @@ def process_scene(scene_name, writer, writer_size):
     orig_seg_len = total_frames // len(FEATURES)
     seg_len = orig_seg_len * repeat
 
-    width = frames[0].shape[1]
-    height = frames[0].shape[0]
+    height, width = frames[0].shape[:2]
 
     pane_w = width // 5  # 5 panes concatenated
-    half = pane_w // 2
 
     font_scale = height / 540 * 0.9
     thk = 2
-    margin = int(15 * font_scale)
-    (_, text_h), _ = cv2.getTextSize("RGB", cv2.FONT_HERSHEY_DUPLEX, font_scale, thk)
+
+    # Labels and divider are rasterized once per segment; the output buffer is reused
+    compositor = SplitCompositor(height, pane_w, font_scale, thk)
 
     total_output_frames = seg_len * len(FEATURES)
+    stop = total_output_frames if stop is None else min(stop, total_output_frames)
 
     target_w, target_h = writer_size
+    needs_resize = (pane_w, height) != writer_size
+    # Output frames may still be queued for the encoder, so rotate enough of them
+    out_ring = BufferRing((target_h, target_w, 3), queue_size + 2 if pipeline else 1)
 
-    for idx in range(total_output_frames):
-        frame = frames[idx % total_frames]  # progress forward, looping at end
+    def render(item):
+        idx, rgb, feat = item
         seg_idx = idx // seg_len
 
-        pane_idx, label = FEATURES[seg_idx]
-        rgb = frame[:, 0:pane_w]
-        feat = frame[:, pane_idx * pane_w:(pane_idx + 1) * pane_w]
-
-        comp = rgb.copy()
-        comp[:, half:] = feat[:, half:]
-        cv2.line(comp, (half, 0), (half, height), (255, 255, 255), 4)
-        put_text(comp, "RGB", (margin, margin + text_h), font_scale, thk)
-        put_text(comp, label, (pane_w - margin, margin + text_h), font_scale, thk, align_right=True)
-        put_text(comp, scene_name.capitalize(), (margin, height - margin), font_scale, thk)
-
-        # Ensure frame matches writer's expected size
-        if (comp.shape[1], comp.shape[0]) != writer_size:
-            comp = cv2.resize(comp, writer_size, interpolation=cv2.INTER_AREA)
-
-        # Convert BGR (OpenCV) → RGB (imageio/FFmpeg expects)
-        writer.append_data(cv2.cvtColor(comp, cv2.COLOR_BGR2RGB))
-
+        _, label = FEATURES[seg_idx]
+        if idx % seg_len == 0 or idx == start:
+            compositor.set_labels("RGB", label, scene_name.capitalize())
+
+        # Writers take BGR frames as they are; only a size mismatch needs a conversion step
+        if not needs_resize:
+            return compositor.compose(rgb, feat, out=out_ring.next())
+        comp = compositor.compose(rgb, feat)
+        with stage("convert", 1):
+            return cv2.resize(comp, writer_size, dst=out_ring.next(), interpolation=cv2.INTER_AREA)
+
+    def write(comp):
+        with stage("encode", 1):
+            writer.write(comp)
+
+    def full_frames():
+        # Progress forward through the clip, looping at the end
+        for idx in range(start, stop):
+            frame = frames[idx % total_frames]
+            pane_idx = FEATURES[idx // seg_len][0]
+            yield idx, frame[:, 0:pane_w], frame[:, pane_idx * pane_w:(pane_idx + 1) * pane_w]
+
+    def split_frames():
+        # ffmpeg delivers [RGB left half | feature right half], so one frame serves as both panes
+        for seg_idx, (pane_idx, _) in enumerate(FEATURES):
+            lo, hi = max(start, seg_idx * seg_len), min(stop, (seg_idx + 1) * seg_len)
+            if lo >= hi:
+                continue
+            for idx, frame in enumerate(iter_split_frames(path, pane_w, height, 0, pane_idx, lo, hi - lo,
+                                                          total_frames, fps), lo):
+                yield idx, frame, frame
+
+    decoded = split_frames() if pane_reader else full_frames()
+    if pipeline:
+        run_pipeline(decoded, render, write, maxsize=queue_size)
+    else:
+        for item in decoded:
+            write(render(item))
+    if hasattr(frames, "close"):
+        frames.close()
+    return max(stop - start, 0)
+
+
+def scene_length(scene_name, total=None):
+    """Number of output frames process_scene writes for a scene whose clip has `total` frames
+    (probed when not given), or None without ffprobe."""
+    total = total or probe_frame_count(VIDEO_PATHS[scene_name])
+    if total is None:
+        return None
+    return total // len(FEATURES) * repeats.get(scene_name, 1) * len(FEATURES)
+
+
+class _FrameSampler:
+    """Writer stand-in that keeps a copy of every frame it is given."""
+
+    def __init__(self):
+        self.frames = []
+
+    def write(self, frame):
+        self.frames.append(frame.copy())
+
+
+def sample_scenes(scenes, writer_size, length=crf_search.SEGMENT_FRAMES):
+    """Rendered (unencoded) reference frames: one segment from the middle of each scene."""
+    samples = []
+    for scene in scenes:
+        n = scene_length(scene)
+        start = max(0, (n - length) // 2) if n else 0
+        sampler = _FrameSampler()
+        process_scene(scene, sampler, writer_size, start=start, stop=start + length)
+        if sampler.frames:
+            samples.append(sampler.frames)
+    return samples
+
+
+def open_writer(path, size, backend="auto", options=None):
+    # H.264 at 8 Mb/s through the chosen (or calibrated) video_writer backend
+    return video_writer.open_writer(path, size, FPS, backend, **(options or ENCODER_OPTIONS))
+
+
+def _render_chunk(task):
+    """Worker: render one scene chunk into its own segment file (None if nothing was written)."""
+    scene, start, stop, frame_count, seg_path, writer_size, pane_reader, backend, options, cache_mb = task
+    cv2.setNumThreads(1)  # parallelism comes from the pool itself
+    writer = open_writer(seg_path, writer_size, backend, options)
+    written = process_scene(scene, writer, writer_size, pane_reader=pane_reader, start=start, stop=stop,
+                            cache_mb=cache_mb, frame_count=frame_count)
+    writer.close()
+    if written == 0:
+        os.remove(seg_path)
+        return None
+    return seg_path
+
+
+def plan_chunks(scenes, chunk_frames=0):
+    """(scene, start, stop, clip frame count) ranges in output order: whole scenes, or
+    chunk_frames-long pieces. Clips are probed once here, so workers never count frames."""
+    chunks = []
+    for scene in scenes:
+        total = probe_frame_count(VIDEO_PATHS[scene]) if chunk_frames > 0 else None
+        if total is None:
+            # Whole scene in one worker: a single sequential decode, no seeking needed
+            chunks.append((scene, 0, None, None))
+            continue
+        n = scene_length(scene, total)
+        for start in range(0, n, chunk_frames):
+            chunks.append((scene, start, min(start + chunk_frames, n), total))
+    return chunks
+
+
+def render_parallel(scenes, writer_size, jobs, chunk_frames=0, pane_reader=False, backend="auto",
+                    options=None, cache_mb=None):
+    """Encode chunks in separate processes, then join the segments with the concat demuxer."""
+    chunks = plan_chunks(scenes, chunk_frames)
+    seg_dir = tempfile.mkdtemp(prefix="segments_", dir=os.path.dirname(OUTPUT))
+    try:
+        tasks = [(scene, start, stop, total, os.path.join(seg_dir, f"{i:04d}_{scene}.mp4"), writer_size,
+                  pane_reader, backend, options, cache_mb)
+                 for i, (scene, start, stop, total) in enumerate(chunks)]
+        print(f"Encoding {len(tasks)} segments with {jobs} workers")
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            segments = [seg for seg in pool.map(_render_chunk, tasks) if seg is not None]
+
+        # Every segment is an independent libx264 encode with identical settings that
+        # starts on an IDR frame, so stream copy joins them losslessly
+        list_path = os.path.join(seg_dir, "segments.txt")
+        with open(list_path, "w") as f:
+            for seg in segments:
+                f.write(f"file '{os.path.abspath(seg)}'\n")
+        # A failed or interrupted join leaves the previous OUTPUT in place
+        with stage("concat"), atomic_output(OUTPUT) as tmp:
+            ffmpeg_runner.run(["ffmpeg", "-v", "error", "-y", "-f", "concat", "-safe", "0", "-i", list_path,
+                               "-c", "copy", tmp], name="concat")
+    finally:
+        shutil.rmtree(seg_dir, ignore_errors=True)
+
+
+def main(force: bool = False, pipeline: bool = False, queue_size: int = 8, pane_reader: bool = False,
+         jobs: int = 1, chunk_sec: float = 0, backend: str = "auto", target_ssim: float = None,
+         target_psnr: float = None, cache_mb: float = None):
+    # Skip the render when the source videos and demo parameters are unchanged
+    cache = BuildCache(force=force)
+    scenes = ["bouquet", "bonsai", "vasedeck"]
+    # Resolve "auto" once so the key and every chunk use the same encoder
+    backend, options = video_writer.resolve(backend, **ENCODER_OPTIONS)
+    target = crf_search.target_from_args(target_ssim, target_psnr)
+    key = cache.key([VIDEO_PATHS[s] for s in scenes], {
+        "scenes": scenes, "repeats": repeats, "features": FEATURES, "fps": FPS,
+        "backend": backend, "encoder": options, "target": target,
+    })
+    if cache.is_fresh("real_demo_combined", key, [OUTPUT]):
+        print(f"[cache] {OUTPUT} is up to date")
+        return
 
-def main():
     first_path = next(iter(VIDEO_PATHS.values()))
     cap0 = cv2.VideoCapture(first_path)
     w = int(cap0.get(cv2.CAP_PROP_FRAME_WIDTH)) // 5  # single pane width
@@ -115,21 +296,61 @@ def main():
 
     os.makedirs(os.path.dirname(OUTPUT), exist_ok=True)
 
-    # Create FFmpeg-based writer via imageio using H.264 (libx264)
-    writer = imageio.get_writer(
-        OUTPUT,
-        fps=FPS,
-        codec="libx264",
-        bitrate="8M",
-        macro_block_size=None,  # allow arbitrary resolution
-    )
+    choice = None
+    if target:
+        # Replace the fixed 8M bitrate by the largest CRF whose samples still meet the target
+        with stage("crf_search"):
+            choice = crf_search.search_crf(sample_scenes(scenes, writer_size), FPS, target[1], target[0],
+                                           backend=backend, **options)
+        options = {**options, "crf": choice["crf"], "bitrate": None}
+
+    if jobs > 1:
+        if pipeline:
+            print("[WARN] --pipeline is ignored with --jobs > 1: the workers already overlap decoding and encoding")
+        render_parallel(scenes, writer_size, jobs, chunk_frames=int(chunk_sec * FPS), pane_reader=pane_reader,
+                        backend=backend, options=options, cache_mb=cache_mb)
+    else:
+        writer = open_writer(OUTPUT, writer_size, backend, options)
+        for scene in scenes:
+            process_scene(scene, writer, writer_size, pipeline=pipeline, queue_size=queue_size,
+                          pane_reader=pane_reader, cache_mb=cache_mb)
+        with stage("encode"):
+            writer.close()
+    if choice:
+        print(f"Recorded CRF {choice['crf']} in {crf_search.record_choice(OUTPUT, choice)}")
+    cache.record("real_demo_combined", key, [OUTPUT])
+    print(f"Wrote {OUTPUT}")
 
-    for scene in ["bouquet", "bonsai", "vasedeck"]:
-        process_scene(scene, writer, writer_size)
 
-    writer.close()
-    print(f"Wrote {OUTPUT}")
+def cli(argv=None):
+    parser = argparse.ArgumentParser(description="Render the combined real-world RGB | feature demo video.")
+    parser.add_argument("--force", action="store_true", help="Ignore the build cache and always re-render")
+    parser.add_argument("--pipeline", action="store_true",
+                        help="Run decode, compositing and encoding in separate threads")
+    parser.add_argument("--queue_size", type=int, default=8, help="Frames buffered between pipeline stages")
+    parser.add_argument("--cache_mb", type=float, default=None,
+                        help="Keep at most this many MB of decoded frames in RAM and spill the rest to disk "
+                             f"(default: the whole clip, or {DEFAULT_CACHE_MB} MB with --pipeline/--pane_reader)")
+    parser.add_argument("--pane_reader", action="store_true",
+                        help="Have ffmpeg crop the two half-panes in use instead of decoding full frames to RAM")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="Encode scenes (or chunks) in this many processes and concat the segments")
+    parser.add_argument("--chunk_sec", type=float, default=0,
+                        help="With --jobs, split scenes into chunks of this many seconds (0 = one per scene)")
+    parser.add_argument("--backend", choices=["auto", *video_writer.BACKENDS], default="auto",
+                        help="Video writer backend (auto: the one picked by `python video_writer.py`)")
+    parser.add_argument("--target_ssim", type=float, default=None,
+                        help="Encode at the largest CRF whose sampled frames keep at least this SSIM (instead of 8M)")
+    parser.add_argument("--target_psnr", type=float, default=None,
+                        help="Like --target_ssim, with a minimum PSNR in dB")
+    parser.add_argument("--trace", default=None, help="Write per-stage timings (Chrome trace JSON) to this path")
+    args = parser.parse_args(argv)
+    if args.trace:
+        media_trace.enable(args.trace)
+    main(force=args.force, pipeline=args.pipeline, queue_size=args.queue_size, pane_reader=args.pane_reader,
+         jobs=args.jobs, chunk_sec=args.chunk_sec, backend=args.backend,
+         target_ssim=args.target_ssim, target_psnr=args.target_psnr, cache_mb=args.cache_mb)
 
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    cli()
@@ -3,13 +3,20 @@ gen_text.py ─ Add an animated title to a video.
 - Renders "Pixie" with an animated gradient and "Physics from Pixels" subtitle.
 - The title fades in and out over 3 seconds.
 - Composites the title onto an input video.
+- "roi" mode re-encodes only the titled head and stream-copies the rest.
 """
 
 from pathlib import Path
 from PIL import Image, ImageDraw, ImageFont
 import numpy as np
-import moviepy.editor as mpy
 import argparse
+import json
+import shutil
+import subprocess
+import tempfile
+
+import media_trace
+from media_trace import stage
 
 
 def lerp(c0, c1, t):
@@ -17,18 +24,15 @@ def lerp(c0, c1, t):
     return tuple(int((1 - t) * a + t * b) for a, b in zip(c0, c1))
 
 
-def add_title_to_video(
-    video_in_path: str,
-    out_path: str,
+def make_title_renderer(
     font_path: str = "/System/Library/Fonts/Cochin.ttc",  # macOS default
     size_large: int = 320,
     size_small: int = 144,
     line_spacing: int = 20,
-    duration: float = 3.0,
-    fade_duration: float = 0.5,
 ):
     """
-    Adds an animated title to the input video and saves it to the output path.
+    Returns make_rgba(t), a function rendering the animated title at time t as an
+    RGBA numpy array. Static layers are built once and the last frame is cached.
     """
     # ──────────────────────────────────── 1.  Fonts & metrics
     try:
@@ -65,39 +69,64 @@ def add_title_to_video(
     x_sub = (width - w_small) // 2
     y_sub = h_big + line_spacing
 
+    # Static layer, rendered once: the subtitle (solid white) on a transparent canvas
+    base = Image.new("RGBA", (width, height), (0, 0, 0, 0))
+    ImageDraw.Draw(base).text((x_sub, y_sub - bbox_small[1]), "Physics from Pixels", font=f_small,
+                              fill=(255, 255, 255, 255))
+
+    # Column positions of the gradient in [0, 1] and the colour stops as an array
+    t_norm = np.arange(w_big) / (w_big - 1) if w_big > 1 else np.zeros(w_big)
+    stops_arr = np.array(stops, dtype=np.float64)
+    grad = np.full((h_big, w_big, 4), 255, dtype=np.uint8)
+
+    def gradient_columns(anim_offset):
+        """Vectorized per-column gradient colours (same maths as `lerp`, one row for all x)."""
+        t_grad = (t_norm + anim_offset) * (len(stops) - 1)
+        seg, seg_t = np.divmod(t_grad, 1)
+        seg = seg.astype(np.int64) % (len(stops) - 1)
+        seg_t = seg_t[:, None]
+        cols = (1 - seg_t) * stops_arr[seg] + seg_t * stops_arr[seg + 1]
+        return cols.astype(np.uint8)
+
     # ──────────────────────────────────── 3.  Frame & mask generation functions
 
+    # make_frame and make_mask are called with the same t; render each t only once
+    cache = {"t": None, "rgba": None}
+
     def make_rgba(t):
         """Return an RGBA numpy array for the animated text at time t."""
-        # Canvas for the text
-        img = Image.new("RGBA", (width, height), (0, 0, 0, 0))
-        draw = ImageDraw.Draw(img)
-
-        # Gradient word "Pixie"
-        grad = Image.new("RGBA", (w_big, h_big))
-        p = grad.load()
+        if cache["t"] == t:
+            return cache["rgba"]
 
-        anim_offset = t / 6.0
+        with stage("text", 1):
+            # Gradient word "Pixie": one column LUT broadcast over every row
+            grad[..., :3] = gradient_columns(t / 6.0)[None]
 
-        for x in range(w_big):
-            t_norm = x / (w_big - 1) if w_big > 1 else 0
-            t_shifted = t_norm + anim_offset
+            img = base.copy()
+            img.paste(Image.fromarray(grad, "RGBA"), (x_pixie, 0), mask)
 
-            t_grad = t_shifted * (len(stops) - 1)
-            seg, seg_t = divmod(t_grad, 1)
-            seg = int(seg) % (len(stops) - 1)
+            cache["t"], cache["rgba"] = t, np.array(img)
+        return cache["rgba"]
 
-            c = lerp(stops[seg], stops[seg + 1], seg_t)
-            for y in range(h_big):
-                p[x, y] = (*c, 255)
+    return make_rgba
 
-        img.paste(grad, (x_pixie, 0), mask)
 
-        # Subtitle (solid white)
-        draw.text((x_sub, y_sub - bbox_small[1]), "Physics from Pixels", font=f_small,
-                  fill=(255, 255, 255, 255))
+def add_title_to_video(
+    video_in_path: str,
+    out_path: str,
+    font_path: str = "/System/Library/Fonts/Cochin.ttc",  # macOS default
+    size_large: int = 320,
+    size_small: int = 144,
+    line_spacing: int = 20,
+    duration: float = 3.0,
+    fade_duration: float = 0.5,
+):
+    """
+    Adds an animated title to the input video and saves it to the output path.
+    """
+    import moviepy.editor as mpy  # slow to import; only this full re-encode path needs it
 
-        return np.array(img)
+    make_rgba = make_title_renderer(font_path, size_large, size_small, line_spacing)
 
     # Color frames: discard alpha channel
     def make_frame(t):
@@ -132,16 +161,256 @@ def add_title_to_video(
 
     # ──────────────────────────────────── 5.  Save
     Path(out_path).parent.mkdir(parents=True, exist_ok=True)
-    final_clip.write_videofile(out_path, codec='libx264', audio_codec='aac')
+    # moviepy decodes, composites and encodes inside one call
+    with stage("write_videofile"):
+        final_clip.write_videofile(out_path, codec='libx264', audio_codec='aac')
     print(f"Saved {out_path}")
 
 
-if __name__ == "__main__":
+def title_alpha_scale(t, duration, fade_duration):
+    """Opacity multiplier of the title at time t (matches vfx.fadein + vfx.fadeout on the mask)."""
+    if t >= duration:
+        return 0.0
+    scale = 1.0
+    if fade_duration > 0:
+        if t < fade_duration:
+            scale *= t / fade_duration
+        if t > duration - fade_duration:
+            scale *= (duration - t) / fade_duration
+    return max(scale, 0.0)
+
+
+def probe_video_stream(video_path: str):
+    """Return (stream info dict, list of (pts_time, is_keyframe)) for the first video stream."""
+    out = subprocess.run(
+        ["ffprobe", "-v", "error", "-select_streams", "v:0",
+         "-show_entries", "stream=codec_name,width,height,r_frame_rate,pix_fmt,profile,level,refs,time_base",
+         "-show_entries", "packet=pts_time,flags",
+         "-of", "json", video_path],
+        check=True, capture_output=True, text=True,
+    ).stdout
+    info = json.loads(out)
+    stream = info["streams"][0]
+    num, den = stream["r_frame_rate"].split("/")
+    stream["fps"] = float(num) / float(den)
+    packets = sorted(
+        (float(p["pts_time"]), "K" in p.get("flags", ""))
+        for p in info.get("packets", []) if p.get("pts_time") not in (None, "N/A")
+    )
+    return stream, packets
+
+
+# ffprobe profile name → libx264 -profile:v
+X264_PROFILES = {
+    "Constrained Baseline": "baseline", "Baseline": "baseline", "Main": "main", "High": "high",
+    "High 10": "high10", "High 4:2:2": "high422", "High 4:4:4 Predictive": "high444",
+}
+
+
+def head_encoder_args(stream):
+    """libx264 arguments making the head's SPS match the source stream, or None if it can't.
+
+    MP4 stores one avcC (SPS/PPS) per track and the stream-copied tail is decoded with
+    the head's, so profile, level, reference frames and the track timescale must agree.
+    """
+    profile = X264_PROFILES.get(stream.get("profile"))
+    level, refs = stream.get("level"), stream.get("refs")
+    if profile is None or not level or level < 0 or not refs:
+        return None
+    args = ["-profile:v", profile, "-level", f"{level / 10:.1f}", "-refs", str(refs)]
+    _, _, timescale = stream.get("time_base", "").partition("/")
+    if timescale.isdigit():
+        args += ["-video_track_timescale", timescale]
+    return args
+
+
+# Frames at the end of the joined video compared against the source
+TAIL_CHECK_FRAMES = 3
+
+
+def count_decoded_frames(video_path: str):
+    """Frames ffprobe decodes from the first video stream; None if it reports any error."""
+    res = subprocess.run(
+        ["ffprobe", "-v", "error", "-select_streams", "v:0", "-count_frames",
+         "-show_entries", "stream=nb_read_frames", "-of", "csv=p=0", video_path],
+        capture_output=True, text=True,
+    )
+    if res.returncode != 0 or res.stderr.strip():
+        return None
+    try:
+        return int(res.stdout.strip())
+    except ValueError:
+        return None
+
+
+def decode_gray_frames(video_path: str, start: float, n: int, width: int, height: int):
+    """Up to `n` grayscale frames of the first video stream from `start` seconds on (accurate seek)."""
+    raw = subprocess.run(
+        ["ffmpeg", "-v", "error", "-ss", f"{start:.6f}", "-i", video_path, "-map", "0:v:0",
+         "-frames:v", str(n), "-f", "rawvideo", "-pix_fmt", "gray", "-"],
+        check=True, capture_output=True,
+    ).stdout
+    return np.frombuffer(raw, np.uint8).reshape(-1, height, width)
+
+
+def tail_frames_match(video_path: str, reference_path: str, start: float, width: int, height: int,
+                      n: int = TAIL_CHECK_FRAMES, tolerance: float = 1.0):
+    """True if `n` frames from `start` seconds on decode the same in both videos.
+
+    Frames are located by timestamp, not index, so both decoders land on the same
+    pictures. The mean absolute difference per frame must stay within `tolerance`
+    (8-bit levels); a tail decoded with the wrong SPS/PPS is garbage, far beyond that.
+    """
+    try:
+        out = decode_gray_frames(video_path, start, n, width, height)
+        ref = decode_gray_frames(reference_path, start, n, width, height)
+    except subprocess.CalledProcessError:
+        return False
+    if len(out) != n or len(ref) != n:
+        return False
+    return all(np.abs(a.astype(np.int16) - b).mean() <= tolerance for a, b in zip(out, ref))
+
+
+def add_title_to_video_roi(
+    video_in_path: str,
+    out_path: str,
+    font_path: str = "/System/Library/Fonts/Cochin.ttc",  # macOS default
+    size_large: int = 320,
+    size_small: int = 144,
+    line_spacing: int = 20,
+    duration: float = 3.0,
+    fade_duration: float = 0.5,
+    crf: int = 18,
+):
+    """
+    Same result as add_title_to_video, but only the leading segment that carries the
+    title is re-encoded (blending just the title's bounding box). Everything from the
+    first keyframe after `duration` on is stream-copied; the original audio track is
+    copied untouched. Both pieces are rewritten to Annex B before ffmpeg's concat demuxer
+    joins them, so each keeps its own SPS/PPS in-band, and the head is encoded with the
+    source's profile, level, refs, pix_fmt and timescale. The joined video must decode to
+    the source's frame count and its last frames must match the source's; otherwise the
+    whole video is re-encoded.
+    """
+    import imageio.v2 as imageio
+    import video_writer
+
+    def full_reencode(reason):
+        print(f"ROI mode not applicable ({reason}), falling back to full re-encode.")
+        return add_title_to_video(video_in_path, out_path, font_path, size_large, size_small,
+                                  line_spacing, duration, fade_duration)
+
+    stream, packets = probe_video_stream(video_in_path)
+    cut = next((pts for pts, key in packets if key and pts >= duration), None)
+    if stream["codec_name"] != "h264":
+        # Tail cannot be stream-copied next to a libx264 head
+        return full_reencode(f"codec is {stream['codec_name']}")
+    if cut is None:
+        return full_reencode(f"no keyframe after {duration}s")
+    sps_args = head_encoder_args(stream)
+    if sps_args is None:
+        return full_reencode(f"cannot match profile {stream.get('profile')!r} level {stream.get('level')}")
+
+    fps = stream["fps"]
+    n_head = sum(1 for pts, _ in packets if pts < cut)
+    W, H = stream["width"], stream["height"]
+
+    make_rgba = make_title_renderer(font_path, size_large, size_small, line_spacing)
+    th, tw = make_rgba(0).shape[:2]
+    # Centered title box, clipped to the frame
+    x0, y0 = (W - tw) // 2, (H - th) // 2
+    fx0, fy0, fx1, fy1 = max(x0, 0), max(y0, 0), min(x0 + tw, W), min(y0 + th, H)
+    tx0, ty0 = fx0 - x0, fy0 - y0
+
+    Path(out_path).parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.TemporaryDirectory() as tmp:
+        head, listing = Path(tmp) / "head.mp4", Path(tmp) / "inputs.txt"
+        # Annex B pieces carry SPS/PPS in-band with every keyframe instead of only in the
+        # avcC, which the concat demuxer takes from the first input alone
+        head_ib, tail_ib = Path(tmp) / "head_inband.mp4", Path(tmp) / "tail_inband.mp4"
+        annexb = ["-bsf:v", "h264_mp4toannexb"]
+        joined = Path(tmp) / f"joined{Path(out_path).suffix}"
+
+        # ──────────────────────────────────── 1.  Re-encode the titled head
+        reader = imageio.get_reader(video_in_path, "ffmpeg")
+        # Always libx264 (never a calibrated hardware encoder): the tail is joined by stream copy
+        writer = video_writer.open_writer(
+            head, (W, H), fps, "ffmpeg", input_format="rgb24",
+            codec="libx264", crf=crf, pix_fmt=stream.get("pix_fmt", "yuv420p"), extra_args=sps_args,
+        )
+        for i, frame in enumerate(media_trace.traced(reader, "decode")):
+            if i >= n_head:
+                break
+            t = i / fps
+            a_scale = title_alpha_scale(t, duration, fade_duration)
+            if a_scale > 0:
+                rgba = make_rgba(t)[ty0:ty0 + fy1 - fy0, tx0:tx0 + fx1 - fx0]
+                with stage("composite", 1):
+                    frame = np.array(frame)  # reader frames are read-only
+                    alpha = rgba[..., 3:] * (a_scale / 255.0)
+                    roi = frame[fy0:fy1, fx0:fx1]
+                    bg = roi.astype(np.float32)
+                    roi[...] = np.rint(bg + (rgba[..., :3] - bg) * alpha)
+            with stage("encode", 1):
+                writer.write(frame)
+        with stage("encode"):
+            writer.close()
+        reader.close()
+
+        # ──────────────────────────────────── 2.  Stream-copy the untouched tail
+        with stage("stream_copy"):
+            subprocess.run(
+                ["ffmpeg", "-y", "-v", "error", "-i", str(head), "-c", "copy", *annexb, str(head_ib)],
+                check=True,
+            )
+            subprocess.run(
+                ["ffmpeg", "-y", "-v", "error", "-ss", f"{cut:.6f}", "-i", video_in_path,
+                 "-map", "0:v:0", "-c", "copy", "-avoid_negative_ts", "make_zero", *annexb, str(tail_ib)],
+                check=True,
+            )
+
+            # ──────────────────────────────────── 3.  Join + original audio
+            listing.write_text(f"file '{head_ib}'\nfile '{tail_ib}'\n")
+            subprocess.run(
+                ["ffmpeg", "-y", "-v", "error", "-f", "concat", "-safe", "0", "-i", str(listing),
+                 "-i", video_in_path, "-map", "0:v", "-map", "1:a?", "-c", "copy",
+                 "-movflags", "+faststart", str(joined)],
+                check=True,
+            )
+
+        # ──────────────────────────────────── 4.  Verify the join decodes cleanly
+        with stage("verify"):
+            n_out = count_decoded_frames(str(joined))
+            # Timestamps relative to the first frame: the join starts at 0 whatever the source did
+            tail_start = packets[-min(TAIL_CHECK_FRAMES, len(packets))][0] - packets[0][0] - 0.5 / fps
+            tail_ok = n_out == len(packets) and tail_frames_match(
+                str(joined), video_in_path, max(tail_start, 0.0), W, H)
+        if n_out != len(packets):
+            return full_reencode(f"joined video decodes to {n_out} frames, source has {len(packets)}")
+        if not tail_ok:
+            return full_reencode("joined video's last frames differ from the source")
+        shutil.move(str(joined), out_path)
+    print(f"Saved {out_path} (re-encoded {n_head} frames, copied tail from {cut:.3f}s)")
+
+
+def cli(argv=None):
     parser = argparse.ArgumentParser(description='Add animated title to a video.')
     parser.add_argument('input_video', help='Path to the input video file.')
     parser.add_argument('-o', '--output_video', default='output.mp4', help='Path to the output video file.')
     # parser.add_argument('--font_path', default="/Users/longle/Downloads/Cochin_Bold/Cochin_Bold.otf", help='Path to the font file.')
     parser.add_argument('--font_path', default="Cochin_Bold/Cochin_Bold.otf", help='Path to the font file.')
-    args = parser.parse_args()
+    parser.add_argument('--mode', choices=['full', 'roi'], default='full',
+                        help='full: re-encode the whole video; roi: re-encode only the titled head and stream-copy the rest.')
+    parser.add_argument('--trace', default=None, help='Write per-stage timings (Chrome trace JSON) to this path.')
+    args = parser.parse_args(argv)
+
+    if args.trace:
+        media_trace.enable(args.trace)
+    if args.mode == 'roi':
+        add_title_to_video_roi(args.input_video, args.output_video, font_path=args.font_path)
+    else:
+        add_title_to_video(args.input_video, args.output_video, font_path=args.font_path)
 
-    add_title_to_video(args.input_video, args.output_video, font_path=args.font_path)
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,122 @@
+"""
+job_runner.py ─ Local bounded-concurrency executor for command lines.
+- Runs jobs concurrently within a CPU slot budget and a set of GPUs.
+- Pins each GPU job to its own devices via CUDA_VISIBLE_DEVICES and caps
+  OMP_NUM_THREADS at the job's CPU slots.
+- Streams each job's stdout/stderr to <log_dir>/<name>.log.
+- Retries failed jobs and keeps going; the caller gets every job's exit code.
+"""
+
+import os
+import shlex
+import subprocess
+import time
+from collections import deque
+
+
+class Job:
+    """One command line and the slots it occupies while running."""
+
+    def __init__(self, name: str, cmd: str, cpus: int = 1, gpus: int = 0):
+        self.name = name
+        self.cmd = cmd
+        self.cpus = cpus
+        self.gpus = gpus
+        self.attempts = 0
+        self.returncode = None
+
+
+def detect_gpus():
+    """Visible GPU ids: $CUDA_VISIBLE_DEVICES if set, else one per `nvidia-smi -L` line."""
+    visible = os.environ.get("CUDA_VISIBLE_DEVICES")
+    if visible is not None:
+        return [g for g in visible.split(",") if g.strip()]
+    try:
+        out = subprocess.run(["nvidia-smi", "-L"], check=True, capture_output=True, text=True).stdout
+    except (FileNotFoundError, subprocess.CalledProcessError):
+        return []
+    return [str(i) for i, line in enumerate(out.splitlines()) if line.startswith("GPU")]
+
+
+def run_jobs(jobs, cpu_slots: int, gpu_ids=(), retries: int = 1, log_dir: str = "logs", poll: float = 0.2):
+    """Run *jobs* with at most *cpu_slots* CPUs and the GPUs in *gpu_ids* in use at once.
+
+    Jobs start in submission order whenever their slots are free (later, smaller
+    jobs may backfill around a job that does not fit yet). A failed job is retried
+    up to *retries* times. Returns {job name: final exit code}.
+    """
+    gpu_ids = list(gpu_ids)
+    for job in jobs:
+        if job.cpus > cpu_slots or job.gpus > len(gpu_ids):
+            raise ValueError(f"Job {job.name} needs {job.cpus} CPUs / {job.gpus} GPUs; "
+                             f"only {cpu_slots} CPUs / {len(gpu_ids)} GPUs available")
+    os.makedirs(log_dir, exist_ok=True)
+
+    pending = deque(jobs)
+    running = []  # (job, proc, gpus, log file)
+    free_cpus = cpu_slots
+    free_gpus = list(gpu_ids)
+
+    def start(job):
+        nonlocal free_cpus
+        gpus = [free_gpus.pop(0) for _ in range(job.gpus)]
+        free_cpus -= job.cpus
+        job.attempts += 1
+        env = dict(os.environ, OMP_NUM_THREADS=str(job.cpus))
+        if any(gpus):  # "" is an unpinned placeholder slot
+            env["CUDA_VISIBLE_DEVICES"] = ",".join(gpus)
+        log = open(os.path.join(log_dir, f"{job.name}.log"), "a" if job.attempts > 1 else "w")
+        log.write(f"### attempt {job.attempts}: {job.cmd}\n")
+        log.flush()
+        where = f" on GPU {','.join(gpus)}" if any(gpus) else ""
+        print(f"[exec] {job.name}{where}: {job.cmd}")
+        try:
+            proc = subprocess.Popen(shlex.split(job.cmd) if isinstance(job.cmd, str) else job.cmd,
+                                    stdout=log, stderr=subprocess.STDOUT, env=env)
+        except OSError as e:
+            # Missing or non-executable program: fail this job like the shell would, keep the rest going
+            log.write(f"Could not start {job.cmd}: {e}\n")
+            finish(job, 127 if isinstance(e, FileNotFoundError) else 126, gpus, log)
+            return
+        running.append((job, proc, gpus, log))
+
+    def finish(job, code, gpus, log):
+        nonlocal free_cpus
+        log.close()
+        free_cpus += job.cpus
+        free_gpus.extend(gpus)
+        job.returncode = code
+        if code == 0:
+            print(f"✅ {job.name} finished")
+        elif job.attempts <= retries:
+            print(f"[WARN] {job.name} failed with exit code {code}; retrying "
+                  f"({job.attempts}/{retries})")
+            pending.appendleft(job)
+        else:
+            print(f"❌ {job.name} failed with exit code {code}; see {log.name}")
+
+    try:
+        while pending or running:
+            for job in list(pending):
+                if job.cpus <= free_cpus and job.gpus <= len(free_gpus):
+                    pending.remove(job)
+                    start(job)
+
+            time.sleep(poll)
+            for entry in list(running):
+                job, proc, gpus, log = entry
+                code = proc.poll()
+                if code is None:
+                    continue
+                running.remove(entry)
+                finish(job, code, gpus, log)
+    except BaseException:
+        # e.g. Ctrl-C: don't leave orphaned renders holding the GPUs
+        for job, proc, _, log in running:
+            proc.terminate()
+        for job, proc, _, log in running:
+            proc.wait()
+            log.close()
+        raise
+
+    return {job.name: job.returncode for job in jobs}
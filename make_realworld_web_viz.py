@@ -1,14 +1,27 @@
 import os
+import shlex
+import shutil
 import socket
 import subprocess
 import argparse
 from pathlib import Path
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 import cv2
 import numpy as np
 import socket
 import subprocess
 import argparse
 import json
+from contextlib import ExitStack
+
+from build_cache import BuildCache
+import crf_search
+import ffmpeg_runner
+from ffmpeg_runner import atomic_output
+from job_runner import Job, detect_gpus, run_jobs
+import media_trace
+from media_trace import stage
 
 # -----------------------------------------------------------------------------
 # Helpers for runtime environment (copied from run_all_teaser_render.py)
@@ -17,6 +30,8 @@ import json
 PANE_W, PANE_H = 960, 540 # chosen pane size
 TARGET_W = PANE_W * 5              # 5-pane concat
 TARGET_H = PANE_H
+CRF = 18                           # libx264 quality for every encode
+RENDITIONS_MANIFEST = "renditions.json"  # read by static/js/real_slider.js
 # TOP, BOTTOM, LEFT, RIGHT
 CROP_DIMS = {
     "vasedeck": (417, 418, 77-77, 77+77),  #-> final dim: (2160, 3840, 3)
@@ -28,40 +43,227 @@ def load_json(path):
     with open(path, "r") as f:
         return json.load(f)
 
-def process_frames(src_dir: Path, crop, out_dir: Path):
+def _init_frame_worker():
+    # One OpenCV thread per process; parallelism comes from the pool itself
+    cv2.setNumThreads(1)
+
+def load_pane_frame(src, crop):
+    """Read one source frame, crop it and Lanczos-resize it to the pane size (None if unreadable)."""
     t, b, l, r = crop
+    im = cv2.imread(str(src))
+    if im is None:
+        return None
+    im = im[t: im.shape[0]-b, l: im.shape[1]-r]
+    # Lanczos resize to pane size
+    return cv2.resize(im, (PANE_W, PANE_H), interpolation=cv2.INTER_LANCZOS4)
+
+def load_pane_frame_rgb(src, crop):
+    """load_pane_frame converted to RGB, matching what ffmpeg decodes from the PNGs."""
+    im = load_pane_frame(src, crop)
+    return None if im is None else cv2.cvtColor(im, cv2.COLOR_BGR2RGB)
+
+def _process_frame(task):
+    """Crop + resize a single frame. Returns the source path on failure, else None."""
+    src, crop, dst = task
+    im = load_pane_frame(src, crop)
+    if im is None or not cv2.imwrite(dst, im):
+        return src
+    return None
+
+def frame_tasks(src_dir: Path, crop, out_dir: Path):
+    """(src, crop, dst) tasks for every PNG in *src_dir*, in sorted (output) order."""
     out_dir.mkdir(parents=True, exist_ok=True)
-    for fn in sorted(src_dir.glob("*.png")):
-        im = cv2.imread(str(fn))
-        im = im[t: im.shape[0]-b, l: im.shape[1]-r]
-        # Lanczos resize to pane size
-        im = cv2.resize(im, (PANE_W, PANE_H), interpolation=cv2.INTER_LANCZOS4)
-        cv2.imwrite(str(out_dir / fn.name), im)
-
-def encode_video(frames_dir: Path, out_mp4: Path, fps: int):
+    return [(str(fn), crop, str(out_dir / fn.name)) for fn in sorted(src_dir.glob("*.png"))]
+
+def run_frame_tasks(tasks, workers: int = 1):
+    """Run crop/resize tasks, fanning out over a process pool when workers > 1.
+    Returns the list of source frames that could not be read or written."""
+    if workers <= 1 or len(tasks) <= 1:
+        results = map(_process_frame, tasks)
+    else:
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_frame_worker)
+        with pool:
+            results = list(pool.map(_process_frame, tasks, chunksize=max(1, len(tasks) // (workers * 4))))
+    return [src for src in results if src is not None]
+
+def process_frames(src_dir: Path, crop, out_dir: Path, workers: int = 1):
+    failed = run_frame_tasks(frame_tasks(src_dir, crop, out_dir), workers)
+    if failed:
+        print(f"[WARN] {len(failed)} frame(s) in {src_dir} could not be processed: {failed}")
+    return failed
+
+def encode_video_job(frames_dir: Path, out_mp4: Path, fps: int):
+    """ffmpeg_runner job encoding the PNGs in *frames_dir* (in name order) to *out_mp4*."""
     # build input list for ffmpeg
+    pngs = sorted(frames_dir.glob('*.png'))
     txt = frames_dir / "inputs.txt"
-    txt.write_text("\n".join([f"file '{f.name}'" for f in sorted(frames_dir.glob('*.png'))]))
-    os.system(
-        f"ffmpeg -y -r {fps} -f concat -safe 0 -i {txt} "
-        f"-c:v libx264 -pix_fmt yuv420p -preset slow -crf 18 "
-        f"-vf scale={PANE_W}:{PANE_H}:flags=lanczos {out_mp4}"
-    )
+    txt.write_text("\n".join([f"file '{f.name}'" for f in pngs]))
+    cmd = ["ffmpeg", "-y", "-r", str(fps), "-f", "concat", "-safe", "0", "-i", str(txt), *x264_args(), str(out_mp4)]
+    return {"cmd": cmd, "name": str(out_mp4), "total_frames": len(pngs)}
+
+def x264_args():
+    """Encoder settings shared by the PNG and streaming encode paths."""
+    return [
+        "-c:v", "libx264", "-pix_fmt", "yuv420p", "-preset", "slow", "-crf", str(CRF),
+        # Same size as the input, so this only pins the RGB→YUV conversion flags
+        "-vf", f"scale={PANE_W}:{PANE_H}:flags=lanczos",
+    ]
 
-def preprocess_object(obj_id, feature_root):
+def encode_frames_streaming(src_dir: Path, crop, out_mp4: Path, fps: int, workers: int = 1):
+    """Crop/resize the source frames and pipe them as raw RGB straight into ffmpeg.
+
+    No intermediate PNGs are written. rgb24 (not bgr24) is piped so swscale takes the
+    same RGB→YUV path as for the PNGs, keeping the output identical to the PNG route. Frames are prepared by a process pool (when
+    workers > 1) with a bounded look-ahead window and fed to ffmpeg in order.
+    Returns the list of source frames that could not be read; raises FFmpegError if
+    the encode fails.
+    """
+    srcs = sorted(src_dir.glob("*.png"))
+    out_mp4.parent.mkdir(parents=True, exist_ok=True)
+    failed = []
+    # A slot of ffmpeg_runner like every other encode; output.mp4 only appears once complete
+    with atomic_output(out_mp4) as tmp, ffmpeg_runner.pipe([
+        "ffmpeg", "-y", "-loglevel", "error",
+        "-f", "rawvideo", "-pix_fmt", "rgb24", "-s", f"{PANE_W}x{PANE_H}", "-r", str(fps), "-i", "-",
+        *x264_args(), tmp,
+    ], name=str(out_mp4), total_frames=len(srcs)) as stdin:
+        def feed(src, im):
+            if im is None:
+                failed.append(str(src))
+            else:
+                with stage("encode", 1):
+                    stdin.write(im.tobytes())
+
+        if workers <= 1:
+            for src in srcs:
+                with stage("crop_resize", 1):
+                    im = load_pane_frame_rgb(src, crop)
+                feed(src, im)
+        else:
+            window = workers * 2
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_frame_worker) as pool:
+                pending = deque()
+                for src in srcs:
+                    pending.append((src, pool.submit(load_pane_frame_rgb, src, crop)))
+                    if len(pending) >= window:
+                        done_src, fut = pending.popleft()
+                        with stage("crop_resize_wait", 1):
+                            im = fut.result()
+                        feed(done_src, im)
+                while pending:
+                    done_src, fut = pending.popleft()
+                    with stage("crop_resize_wait", 1):
+                        im = fut.result()
+                    feed(done_src, im)
+    return failed
+
+def object_fps(obj_id):
     HOME_PATH_PREFIX = Path("/home/vlongle/code/diffPhys3d")
     config_path = HOME_PATH_PREFIX / "third_party" / "PhysGaussian" / "config" / "real_scene" / f"custom_{obj_id}_viz_config.json"
     config = load_json(config_path)
-    fps = int(1.0 / config["frame_dt"])
-    crop = CROP_DIMS[obj_id]
-    for feat in ["rgb", "material", "E", "density", "nu"]:
-        frames = feature_root / obj_id / feat / "frames"
-        out_frames = frames.parent / "processed_frames"
-        os.system(f"rm -rf {out_frames}")
-        process_frames(frames, crop, out_frames)
-        encode_video(out_frames, out_frames / "output.mp4", fps)
+    return int(1.0 / config["frame_dt"])
 
+def fused_filtergraph(crop, n_inputs: int, thumbnail: bool = False):
+    """Per-input crop + Lanczos scale to the pane size, hstack, optional first-pane thumbnail branch."""
+    t, b, l, r = crop
+    chains = [
+        f"[{i}:v]crop=iw-{l + r}:ih-{t + b}:{l}:{t},scale={PANE_W}:{PANE_H}:flags=lanczos[p{i}]"
+        for i in range(n_inputs)
+    ]
+    stack = "".join(f"[p{i}]" for i in range(n_inputs)) + f"hstack=inputs={n_inputs}"
+    if thumbnail:
+        chains.append(f"{stack},split=2[v][t]")
+        chains.append(f"[t]trim=end_frame=1,crop={PANE_W}:{PANE_H}:0:0[thumb]")
+    else:
+        chains.append(f"{stack}[v]")
+    return ";".join(chains)
+
+def encode_object_fused(obj_id, feature_root, features, output_video, thumb_path=None, fps=None):
+    """Build the 5-pane concat video straight from the raw feature frames in a single ffmpeg run.
+
+    Replaces per-feature encodes + a second hstack re-encode with one filtergraph
+    (crop → Lanczos scale → hstack) and one libx264 encode. When *thumb_path* is
+    given the thumbnail is taken from the same run. Returns False if any feature's
+    frames are missing.
+    """
+    fps = object_fps(obj_id) if fps is None else fps
+    frame_dirs = [Path(feature_root) / obj_id / feat / "frames" for feat in features]
+    missing = [str(d) for d in frame_dirs if not any(d.glob("*.png"))]
+    if missing:
+        print(f"[WARN] Missing frames for {obj_id}: {missing}. Skipping fused encode.")
+        return False
+
+    inputs = []
+    for d in frame_dirs:
+        inputs += ["-framerate", str(fps), "-pattern_type", "glob", "-i", str(d / "*.png")]
+    os.makedirs(os.path.dirname(os.path.abspath(output_video)), exist_ok=True)
+    with ExitStack() as outputs:
+        cmd = [
+            "ffmpeg", "-y", *inputs,
+            "-filter_complex", fused_filtergraph(CROP_DIMS[obj_id], len(frame_dirs), thumbnail=thumb_path is not None),
+            "-map", "[v]", "-c:v", "libx264", "-pix_fmt", "yuv420p", "-preset", "slow", "-crf", str(CRF),
+            outputs.enter_context(atomic_output(output_video)),
+        ]
+        if thumb_path is not None:
+            cmd += ["-map", "[thumb]", "-frames:v", "1", "-q:v", "2", outputs.enter_context(atomic_output(thumb_path))]
+        with stage("fused_encode"):
+            ffmpeg_runner.run(cmd, name=f"{obj_id} fused", total_frames=len(list(frame_dirs[0].glob("*.png"))))
+    return True
+
+def preprocess_object(obj_id, feature_root, features=("rgb", "material", "E", "density", "nu"), workers: int = 1,
+                      stream: bool = True, cache: BuildCache = None):
+    fps = object_fps(obj_id)
+    crop = CROP_DIMS[obj_id]
 
+    # Skip features whose frames and encode parameters are unchanged since the last build
+    stale = []
+    for feat in features:
+        frames = feature_root / obj_id / feat / "frames"
+        out_mp4 = frames.parent / "processed_frames" / "output.mp4"
+        if cache is not None:
+            key = cache.key([frames], {"crop": crop, "pane": [PANE_W, PANE_H], "fps": fps, "crf": CRF})
+            if cache.is_fresh(f"encode:{obj_id}/{feat}", key, [out_mp4]):
+                print(f"[cache] {obj_id}/{feat} unchanged, skipping encode")
+                continue
+            stale.append((feat, frames, out_mp4, key))
+        else:
+            stale.append((feat, frames, out_mp4, None))
+
+    def record(feat, out_mp4, key, failed):
+        # A video missing frames must be rebuilt next time, not cached as up to date
+        if cache is not None and not failed and out_mp4.exists():
+            cache.record(f"encode:{obj_id}/{feat}", key, [out_mp4])
+
+    if stream:
+        # Frames go straight from the source PNGs into ffmpeg; only output.mp4 is written
+        for feat, frames, out_mp4, key in stale:
+            shutil.rmtree(out_mp4.parent, ignore_errors=True)
+            failed = encode_frames_streaming(frames, crop, out_mp4, fps, workers)
+            if failed:
+                print(f"[WARN] {obj_id}/{feat}: {len(failed)} frame(s) could not be read: {failed}")
+            record(feat, out_mp4, key, failed)
+        return
+
+    # Crop/resize the frames of all features in one pool so every core stays busy
+    tasks = []
+    for feat, frames, out_mp4, key in stale:
+        out_frames = out_mp4.parent
+        shutil.rmtree(out_frames, ignore_errors=True)
+        tasks += frame_tasks(frames, crop, out_frames)
+
+    with stage("crop_resize", len(tasks)):
+        failed = run_frame_tasks(tasks, workers)
+    if failed:
+        print(f"[WARN] {obj_id}: {len(failed)} frame(s) could not be processed:")
+        for src in failed:
+            print(f"   {src}")
+
+    # Encode the features concurrently (as many at once as ffmpeg_runner allows)
+    jobs = [encode_video_job(out_mp4.parent, out_mp4, fps) for _, _, out_mp4, _ in stale]
+    with stage("encode", sum(job["total_frames"] for job in jobs)):
+        ffmpeg_runner.run_all(jobs)
+    for feat, frames, out_mp4, key in stale:
+        record(feat, out_mp4, key, [src for src in failed if Path(src).parent == frames])
 
 
 
@@ -84,31 +286,218 @@ def on_desktop():
     return get_ip_address() == local_desktop_ip
 
 
+# -----------------------------------------------------------------------------
+# Post-processing
+# -----------------------------------------------------------------------------
+
+
+def encode_pair_renditions(concat_video, out_dir, features, published="concat.mp4"):
+    """Cut "RGB | feature" two-pane videos out of the CRF 18 master concat and write their manifest.
+
+    The concat holds one PANE_W-wide pane per entry of *features* (features[0] is RGB).
+    Cutting from the master rather than the published copy avoids stacking a second
+    generation of compression on a possibly CRF-reduced video. All renditions come from
+    a single decode of the concat; the manifest names *published* as the five-pane
+    fallback. Returns the manifest dict.
+    """
+    n = len(features) - 1
+    graph = [f"[0:v]split={2 * n}" + "".join(f"[a{i}][b{i}]" for i in range(1, n + 1))]
+    for i in range(1, n + 1):
+        graph.append(f"[a{i}]crop={PANE_W}:{PANE_H}:0:0[l{i}]")
+        graph.append(f"[b{i}]crop={PANE_W}:{PANE_H}:{i * PANE_W}:0[r{i}]")
+        graph.append(f"[l{i}][r{i}]hstack[o{i}]")
+
+    cmd = ["ffmpeg", "-v", "error", "-y", "-i", concat_video, "-filter_complex", ";".join(graph)]
+    entries = []
+    with ExitStack() as outputs:
+        for i, feat in enumerate(features[1:], start=1):
+            name = f"pair_{feat}.mp4"
+            cmd += ["-map", f"[o{i}]", "-c:v", "libx264", "-preset", "slow", "-crf", str(CRF),
+                    "-pix_fmt", "yuv420p", "-movflags", "+faststart",
+                    outputs.enter_context(atomic_output(os.path.join(out_dir, name)))]
+            entries.append({"name": feat, "src": name})
+        with stage("renditions"):
+            ffmpeg_runner.run(cmd, name=f"{os.path.basename(out_dir)} renditions")
+
+    for entry in entries:
+        entry["bytes"] = os.path.getsize(os.path.join(out_dir, entry["src"]))
+    manifest = {
+        "layout": "pair",            # each rendition is [RGB | feature]
+        "pane": [PANE_W, PANE_H],
+        "concat": published,
+        "features": entries,         # in switcher order
+    }
+    with atomic_output(os.path.join(out_dir, RENDITIONS_MANIFEST)) as tmp, open(tmp, "w") as f:
+        json.dump(manifest, f, indent=2)
+    print(f"Wrote {n} two-pane renditions and {RENDITIONS_MANIFEST} to {out_dir}")
+    return manifest
+
+
+def postprocess_object(obj_id, args, cache, path_prefix):
+    """Preprocess, concatenate, publish and thumbnail one object's feature renders."""
+    feature_root = Path("/mnt/kostas-graid/datasets/vlongle/diffphys3d/test_viz_gs_clip")
+    output_video = (
+        f"test_viz_gs_{args.model_feature}/{obj_id}/concat_{'_'.join(args.features)}.mp4"
+    )
+
+    # Copy to website folder and generate thumbnail
+    # web_dir = f"umi-on-legs.github.io/static/videos/ours_real_world/renders/{obj_id}"
+    web_dir = f"/home/vlongle/code/pixie-3d.github.io/static/videos/ours_real_world/renders/{obj_id}"
+    os.makedirs(web_dir, exist_ok=True)
+    target_video = os.path.join(web_dir, "concat.mp4")
+    thumb_path = os.path.join(web_dir, "thumbnail.jpg")
+
+    if args.fused:
+        # One decode/filter/encode pass per object; thumbnail comes from the same run
+        frame_dirs = [feature_root / obj_id / feat / "frames" for feat in args.features]
+        key = cache.key(frame_dirs, {"crop": CROP_DIMS[obj_id], "pane": [PANE_W, PANE_H],
+                                     "features": args.features, "fps": object_fps(obj_id), "crf": CRF})
+        if cache.is_fresh(f"fused:{obj_id}", key, [output_video, thumb_path]):
+            print(f"[cache] {obj_id} unchanged, skipping fused encode")
+        elif encode_object_fused(obj_id, feature_root, args.features, output_video, thumb_path=thumb_path):
+            cache.record(f"fused:{obj_id}", key, [output_video, thumb_path])
+        else:
+            return
+    else:
+        preprocess_object(obj_id, feature_root,
+                          features=args.features, workers=args.workers,
+                          stream=args.encode_mode == "stream", cache=cache)
+        input_videos = [
+            f"{path_prefix}/test_viz_gs_{args.model_feature}/{obj_id}/{feat}/processed_frames/output.mp4"
+            for feat in args.features
+        ]
+
+        missing = [v for v in input_videos if not os.path.exists(v)]
+        if missing:
+            print(f"[WARN] Missing videos for {obj_id}: {missing}. Skipping concatenation.")
+            return
+
+        key = cache.key(input_videos, {"features": args.features, "crf": CRF})
+        if cache.is_fresh(f"concat:{obj_id}", key, [output_video]):
+            print(f"[cache] {obj_id} feature videos unchanged, skipping concatenation")
+        else:
+            # Build ffmpeg concat command (horizontal stack)
+            ffmpeg_inputs = [arg for v in input_videos for arg in ("-i", v)]
+            filter_inputs = "".join([f"[{idx}:v]" for idx in range(len(input_videos))])
+            filter_complex = f"{filter_inputs}hstack=inputs={len(input_videos)}[v]"
+
+            ffmpeg_path = "ffmpeg" ## have to be on a compute node.NOT the login node.
+            os.makedirs(os.path.dirname(os.path.abspath(output_video)), exist_ok=True)
+            with stage("concat"), atomic_output(output_video) as tmp:
+                ffmpeg_runner.run(
+                    [ffmpeg_path, "-y", *ffmpeg_inputs, "-filter_complex", filter_complex,
+                     "-map", "[v]", "-c:v", "libx264", "-preset", "slow", "-crf", str(CRF), tmp],
+                    name=f"{obj_id} concat",
+                )
+            cache.record(f"concat:{obj_id}", key, [output_video])
+
+    target = crf_search.target_from_args(args.target_ssim, args.target_psnr)
+    key = cache.key([output_video], {"pane": [PANE_W, PANE_H], "target": target})
+    if cache.is_fresh(f"publish:{obj_id}", key, [target_video, thumb_path]):
+        print(f"[cache] {target_video} is up to date")
+    else:
+        with stage("publish"):
+            if target:
+                # Smallest CRF-controlled copy that still meets the target against the CRF 18 master
+                choice = crf_search.encode_to_target(output_video, target_video, *target)
+                how = f"re-encoded at CRF {choice['crf']}"
+            else:
+                # Hard link (or copy across filesystems) + rename: the page never sees a partial file
+                how = ffmpeg_runner.publish(output_video, target_video)
+        print(f"Published {output_video} to {target_video} ({how})")
+
+        if not args.fused:
+            with stage("thumbnail"), atomic_output(thumb_path) as tmp:
+                ffmpeg_runner.run(["ffmpeg", "-y", "-i", target_video, "-vf", f"crop={PANE_W}:{PANE_H}:0:0",
+                                   "-frames:v", "1", "-q:v", "2", tmp], name=f"{obj_id} thumbnail")
+        print(f"Generated thumbnail at {thumb_path}")
+        cache.record(f"publish:{obj_id}", key, [target_video, thumb_path])
+
+    # Two-pane RGB | feature renditions for the web viewer
+    manifest_path = os.path.join(web_dir, RENDITIONS_MANIFEST)
+    pair_paths = [os.path.join(web_dir, f"pair_{feat}.mp4") for feat in args.features[1:]]
+    key = cache.key([output_video], {"features": args.features, "pane": [PANE_W, PANE_H], "crf": CRF})
+    if cache.is_fresh(f"renditions:{obj_id}", key, pair_paths + [manifest_path]):
+        print(f"[cache] {obj_id} renditions are up to date")
+    else:
+        encode_pair_renditions(output_video, web_dir, args.features,
+                               published=os.path.basename(target_video))
+        cache.record(f"renditions:{obj_id}", key, pair_paths + [manifest_path])
+
+
 # -----------------------------------------------------------------------------
 # Slurm helpers
 # -----------------------------------------------------------------------------
 
 
-def submit_to_slurm(cmd: str, *, idx: int, args):
-    """Submit *cmd* to Slurm using *sbatch --wrap* with the CLI parameters."""
+def submit_to_slurm(cmd: str, *, name: str, args, array: int = None, dependency: str = None,
+                    gpus: str = None, cpus: str = None) -> str:
+    """Submit *cmd* with *sbatch --parsable --wrap* and return the job id.
+
+    array:      number of array tasks (the command reads $SLURM_ARRAY_TASK_ID)
+    dependency: e.g. "afterok:1234"; the job only starts once that job succeeded
+    """
     os.makedirs("slurm_outs/realworld_viz", exist_ok=True)
 
-    job_name = f"{args.job_name}_{idx}"
+    log_name = f"{name}-%A_%a" if array else f"{name}-%j"
     sbatch_cmd = [
-        "sbatch",
-        f"--job-name={job_name}",
-        f"--output=slurm_outs/realworld_viz/{job_name}-%j.out",
+        args.sbatch,
+        "--parsable",
+        f"--job-name={name}",
+        f"--output=slurm_outs/realworld_viz/{log_name}.out",
         f"--time={args.time}",
         f"--partition={args.partition}",
         f"--qos={args.qos}",
-        f"--gpus={args.gpus}",
         f"--mem={args.mem}",
-        f"--cpus-per-task={args.cpus}",
-        "--wrap",
-        cmd,
+        f"--cpus-per-task={cpus or args.cpus}",
+    ]
+    if gpus:
+        sbatch_cmd.append(f"--gpus={gpus}")
+    if array:
+        sbatch_cmd.append(f"--array=0-{array - 1}")
+    if dependency:
+        sbatch_cmd.append(f"--dependency={dependency}")
+    sbatch_cmd += ["--wrap", cmd]
+    print("[sbatch] " + shlex.join(sbatch_cmd))
+    out = subprocess.run(sbatch_cmd, check=True, capture_output=True, text=True).stdout
+    # --parsable prints "jobid" or "jobid;cluster"
+    return out.strip().split(";")[0]
+
+
+def submit_object(obj_id: str, args) -> str:
+    """One job array over the features of *obj_id* plus a post-processing job chained with afterok."""
+    # --wrap runs under /bin/sh, so pick the feature positionally instead of with a bash array
+    viz_cmd = (
+        f"set -- {shlex.join(args.features)}; shift $SLURM_ARRAY_TASK_ID; "
+        f"python run_viz.py --obj_id {shlex.quote(obj_id)} --feature \"$1\" "
+        f"--model_feature {shlex.quote(args.model_feature)}"
+    )
+    array_id = submit_to_slurm(viz_cmd, name=f"{args.job_name}_{obj_id}", args=args,
+                               array=len(args.features), gpus=args.gpus)
+
+    post_argv = [
+        "python", "make_realworld_web_viz.py", "--postprocess_only",
+        "--obj_ids", obj_id, "--features", *args.features, "--model_feature", args.model_feature,
+        "--encode_mode", args.encode_mode, "--workers", str(args.post_cpus),
     ]
-    print("[sbatch] " + " ".join(sbatch_cmd))
-    subprocess.run(sbatch_cmd, check=True)
+    if args.fused:
+        post_argv.append("--fused")
+    if args.force:
+        post_argv.append("--force")
+    if args.target_ssim is not None:
+        post_argv += ["--target_ssim", str(args.target_ssim)]
+    if args.target_psnr is not None:
+        post_argv += ["--target_psnr", str(args.target_psnr)]
+    if args.ffmpeg_jobs is not None:
+        post_argv += ["--ffmpeg_jobs", str(args.ffmpeg_jobs)]
+    if args.trace:
+        # One trace per post-processing job, or they would overwrite each other
+        root, ext = os.path.splitext(args.trace)
+        post_argv += ["--trace", f"{root}_{obj_id}{ext or '.json'}"]
+    post_id = submit_to_slurm(shlex.join(post_argv), name=f"{args.job_name}_{obj_id}_post", args=args,
+                              dependency=f"afterok:{array_id}", cpus=args.post_cpus)
+    print(f"[sbatch] {obj_id}: array job {array_id} ({len(args.features)} tasks) → post-processing job {post_id}")
+    return post_id
 
 
 # -----------------------------------------------------------------------------
@@ -116,13 +505,22 @@ def submit_to_slurm(cmd: str, *, idx: int, args):
 # -----------------------------------------------------------------------------
 
 
-def parse_args() -> argparse.Namespace:
+def parse_args(argv=None) -> argparse.Namespace:
     p = argparse.ArgumentParser(
         description="Visualize real-world objects either locally or via Slurm",
         formatter_class=argparse.ArgumentDefaultsHelpFormatter,
     )
 
-    p.add_argument("--slurm", action="store_true", help="Submit each run_viz.py call as its own Slurm job.")
+    p.add_argument(
+        "--slurm",
+        action="store_true",
+        help="Submit one Slurm job array per object plus a dependent post-processing job.",
+    )
+    p.add_argument(
+        "--postprocess_only",
+        action="store_true",
+        help="Skip run_viz.py and only preprocess/concat/copy/thumbnail (used by the post-processing job).",
+    )
 
     p.add_argument(
         "--obj_ids",
@@ -152,8 +550,47 @@ def parse_args() -> argparse.Namespace:
     p.add_argument("--gpus", default="1", help="GPUs per job (passed to --gpus)")
     p.add_argument("--mem", default="64G", help="Memory per job")
     p.add_argument("--cpus", default="64", help="CPUs per task")
+    p.add_argument("--post_cpus", default="16", help="CPUs for the (GPU-less) post-processing job")
+    p.add_argument("--sbatch", default="sbatch", help="sbatch executable (e.g. ./fake_sbatch.py to test offline)")
+
+    p.add_argument(
+        "--encode_mode",
+        choices=["stream", "png"],
+        default="stream",
+        help="stream: pipe cropped frames straight into ffmpeg; png: write processed_frames/*.png first.",
+    )
 
-    return p.parse_args()
+    p.add_argument(
+        "--fused",
+        action="store_true",
+        help="Build each concat video in one ffmpeg pass (crop+scale+hstack) from the raw feature frames.",
+    )
+
+    # Local scheduler options (used when running run_viz.py on this machine)
+    p.add_argument("--local_cpus", type=int, default=os.cpu_count(), help="CPU slots shared by local renders")
+    p.add_argument("--local_gpus", type=int, default=None, help="GPUs to use locally (default: all visible)")
+    p.add_argument("--local_job_cpus", type=int, default=8, help="CPU slots reserved by each local render")
+    p.add_argument("--retries", type=int, default=1, help="Retries for a failed local render")
+    p.add_argument("--log_dir", default="logs/realworld_viz", help="Per-job logs of local renders")
+
+    p.add_argument("--target_ssim", type=float, default=None,
+                   help="Publish each concat at the largest CRF keeping this SSIM against the master (default: as-is).")
+    p.add_argument("--target_psnr", type=float, default=None,
+                   help="Like --target_ssim, with a minimum PSNR in dB.")
+    p.add_argument("--ffmpeg_jobs", type=int, default=None,
+                   help="Max concurrent ffmpeg encodes during post-processing (default: one per "
+                        f"{ffmpeg_runner.ENCODE_THREADS} cores of the machine running it).")
+    p.add_argument("--force", action="store_true", help="Ignore the build cache and rebuild every stage.")
+    p.add_argument("--trace", default=None, help="Write per-stage timings (Chrome trace JSON) to this path.")
+
+    p.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count(),
+        help="Worker processes for frame crop/resize during post-processing.",
+    )
+
+    return p.parse_args(argv)
 
 
 # -----------------------------------------------------------------------------
@@ -161,94 +598,66 @@ def parse_args() -> argparse.Namespace:
 # -----------------------------------------------------------------------------
 
 
-def main():
-    args = parse_args()
+def main(argv=None):
+    args = parse_args(argv)
+    if args.trace:
+        media_trace.enable(args.trace)
+    ffmpeg_runner.configure(args.ffmpeg_jobs)
 
     # Decide default execution mode: desktop → local, cluster → slurm (no explicit warning)
-    cmd_idx = 0
+    cache = BuildCache(force=args.force)
 
     path_prefix = "/mnt/kostas-graid/datasets/vlongle/diffphys3d" if not on_desktop() else "/home/vlongle/diffPhys3d"
-    for obj_id in args.obj_ids:
-        # First submit / execute heavy run_viz.py jobs for each feature
-        for feature in args.features:
-            cmd = (
-                f"python run_viz.py --obj_id {obj_id} --feature {feature} "
-                f"--model_feature {args.model_feature}"
-            )
-
-            if args.slurm:
-                submit_to_slurm(cmd, idx=cmd_idx, args=args)
-                cmd_idx += 1
-            elif on_desktop():
-                print("[exec]", cmd)
-                ret = os.system(cmd)
-                if ret != 0:
-                    raise RuntimeError(f"Command failed with exit code {ret >> 8}")
-
-
-        # -------------------------------------------------------------
-        # Post-processing (concatenate + copy) – only when running locally
-        # -------------------------------------------------------------
-        if not args.slurm:
-            preprocess_object(obj_id, Path("/mnt/kostas-graid/datasets/vlongle/diffphys3d/test_viz_gs_clip"))
-            input_videos = [
-                f"{path_prefix}/test_viz_gs_{args.model_feature}/{obj_id}/{feat}/processed_frames/output.mp4"
-                for feat in args.features
-            ]
-
-            missing = [v for v in input_videos if not os.path.exists(v)]
-            if missing:
-                print(f"[WARN] Missing videos for {obj_id}: {missing}. Skipping concatenation.")
-                continue
-
-            # Build ffmpeg concat command (horizontal stack)
-            ffmpeg_inputs = " ".join([f"-i {v}" for v in input_videos])
-            filter_inputs = "".join([f"[{idx}:v]" for idx in range(len(input_videos))])
-            filter_complex = f"{filter_inputs}hstack=inputs={len(input_videos)}[v]"
-
-            output_video = (
-                f"test_viz_gs_{args.model_feature}/{obj_id}/concat_{'_'.join(args.features)}.mp4"
-            )
-
-            ffmpeg_path = "ffmpeg" ## have to be on a compute node.NOT the login node.
-            ffmpeg_cmd = (
-                f"{ffmpeg_path} -y {ffmpeg_inputs} -filter_complex '{filter_complex}' "
-                f"-map '[v]' -c:v libx264 -preset slow -crf 18 {output_video}"
-            )
-            print("[exec]", ffmpeg_cmd)
-            os.system(ffmpeg_cmd)
-
-            # Copy to website folder and generate thumbnail
-            # web_dir = f"umi-on-legs.github.io/static/videos/ours_real_world/renders/{obj_id}"
-            web_dir = f"/home/vlongle/code/pixie-3d.github.io/static/videos/ours_real_world/renders/{obj_id}"
-            os.makedirs(web_dir, exist_ok=True)
-
-            target_video = os.path.join(web_dir, "concat.mp4")
-            os.system(f"cp {output_video} {target_video}")
-            print(f"Copied {output_video} to {target_video}")
-
-            thumb_path = os.path.join(web_dir, "thumbnail.jpg")
-
-            thumb_cmd = (
-                f"ffmpeg -y -i {target_video} "
-                f"-vf crop={PANE_W}:{PANE_H}:0:0 -vframes 1 -q:v 2 {thumb_path}"
-            )
-            os.system(thumb_cmd)
-            print(f"Generated thumbnail at {thumb_path}")
 
+    # Local mode: run every (object, feature) render concurrently within the CPU/GPU slots
+    failed_objs = set()
+    failed_post = set()
+    if not args.slurm and not args.postprocess_only and on_desktop():
+        gpu_ids = detect_gpus()[:args.local_gpus] if args.local_gpus is not None else detect_gpus()
+        if not gpu_ids:
+            print("[WARN] No GPUs in use (none detected, or --local_gpus 0); "
+                  "running one render at a time without GPU pinning")
+            gpu_ids = [""]
+        jobs = [
+            Job(f"{obj_id}_{feature}",
+                f"python run_viz.py --obj_id {obj_id} --feature {feature} --model_feature {args.model_feature}",
+                cpus=min(args.local_job_cpus, args.local_cpus), gpus=1)
+            for obj_id in args.obj_ids
+            for feature in args.features
+        ]
+        with stage("run_viz"):
+            codes = run_jobs(jobs, cpu_slots=args.local_cpus, gpu_ids=gpu_ids,
+                             retries=args.retries, log_dir=args.log_dir)
+        failed_objs = {obj_id for obj_id in args.obj_ids
+                       if any(codes[f"{obj_id}_{feature}"] != 0 for feature in args.features)}
 
+    for obj_id in args.obj_ids:
+        if args.slurm:
+            # Rendering and post-processing both run on the cluster
+            submit_object(obj_id, args)
+        elif obj_id in failed_objs:
+            print(f"[WARN] run_viz.py failed for {obj_id}; skipping its post-processing")
+        else:
+            try:
+                postprocess_object(obj_id, args, cache, path_prefix)
+            except RuntimeError as e:  # FFmpegError, or e.g. a video that cannot be probed
+                print(f"❌ Post-processing {obj_id} failed: {e}")
+                failed_post.add(obj_id)
 
     if args.slurm:
         print(
-            "✅ All run_viz.py jobs submitted to Slurm. Concatenation/copy steps are skipped.\n"
-            "   Re-run this script without --slurm after the jobs finish to perform video stitching."
+            "✅ Submitted one run_viz.py job array per object; each object's post-processing job\n"
+            "   (preprocess, concat, copy, thumbnail) starts automatically once its array succeeds."
         )
+    errors = []
+    if failed_objs:
+        errors.append(f"❌ Rendering failed for: {', '.join(sorted(failed_objs))} (logs in {args.log_dir})")
+    if failed_post:
+        errors.append(f"❌ Post-processing failed for: {', '.join(sorted(failed_post))}")
+    if errors:
+        # Non-zero exit so a dependent (afterok) Slurm job or calling script does not carry on
+        raise SystemExit("\n".join(errors))
 
 
 if __name__ == "__main__":
     main()
-
-
-
-
-
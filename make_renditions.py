@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+make_renditions.py ─ Resolution/bitrate ladder, posters and manifest for the site videos.
+- For every .mp4 under static/videos, encodes 360p/540p/1080p H.264 renditions
+  (never upscaling) in one decode, with the moov atom up front (faststart).
+- Grabs the first frame as a JPEG poster, so the page shows something before playback.
+- Writes static/videos/renditions.json, which static/js/renditions.js reads to pick
+  the smallest rendition that covers each <video> at the current viewport size.
+- --html marks the <video> tags of a page whose source has renditions, so the browser
+  waits for that choice instead of fetching the original (a <noscript> copy keeps the
+  plain source for visitors without JavaScript).
+- Skips videos whose source and ladder settings are unchanged (build cache).
+
+Outputs sit next to their source: clip.mp4 → clip.360p.mp4, clip.540p.mp4, clip.poster.jpg
+"""
+
+import argparse
+import json
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+
+from analyze_video_dims import probe_video
+from build_cache import BuildCache
+import ffmpeg_runner
+from ffmpeg_runner import atomic_output
+import media_trace
+from media_trace import stage
+
+VIDEO_ROOT = "static/videos"
+MANIFEST = os.path.join(VIDEO_ROOT, "renditions.json")
+
+# height → (crf, max kbit/s for a 16:9 frame of that height; scaled by width for other aspects)
+LADDER = {
+    360: (26, 1000),
+    540: (23, 2500),
+    1080: (21, 6000),
+}
+POSTER_HEIGHT = 540
+
+_RENDITION_RE = re.compile(r"\.\d+p\.mp4$")
+# Written by make_realworld_web_viz.py, which publishes its own per-feature pair renditions
+# and rendition manifest for the real-world viewer
+_REALWORLD_RE = re.compile(r"^(concat|pair_.+)\.mp4$")
+
+
+def find_sources(root=VIDEO_ROOT):
+    """Every source .mp4 under *root*, excluding renditions written by this script and the
+    real-world viewer's concat/pair videos."""
+    found = []
+    for dirpath, _, files in os.walk(root):
+        for fname in files:
+            if (fname.lower().endswith(".mp4") and not _RENDITION_RE.search(fname)
+                    and not _REALWORLD_RE.match(fname) and ".part-" not in fname):
+                found.append(os.path.join(dirpath, fname))
+    return sorted(found)
+
+
+def rendition_path(src, height):
+    return f"{os.path.splitext(src)[0]}.{height}p.mp4"
+
+
+def poster_path(src):
+    return f"{os.path.splitext(src)[0]}.poster.jpg"
+
+
+def plan_rungs(width, height, heights):
+    """Ladder rungs for a width x height source, never upscaling: rungs above the source
+    collapse into one rung at the source's own height."""
+    rungs = []
+    for h in sorted(heights):
+        rungs.append(min(h, height))
+        if h >= height:
+            break
+    plan = []
+    for h in rungs:
+        w = int(round(width * h / height / 2)) * 2  # x264 needs even dimensions
+        crf, kbps = LADDER[h] if h in LADDER else LADDER[min(LADDER, key=lambda k: abs(k - h))]
+        kbps = int(kbps * max(1.0, (w * h) / (h * 16 / 9 * h)))
+        plan.append({"height": h, "width": w, "crf": crf, "maxrate_kbps": kbps})
+    return plan
+
+
+def build_video(src, heights):
+    """Encode every rung and the poster of *src* in one ffmpeg run; return its manifest entry."""
+    info = probe_video(src)
+    if info is None or not info["width"]:
+        raise RuntimeError(f"Cannot probe {src}")
+    rungs = plan_rungs(info["width"], info["height"], heights)
+    poster_h = min(POSTER_HEIGHT, info["height"])
+
+    n = len(rungs) + 1
+    graph = [f"[0:v]split={n}" + "".join(f"[v{i}]" for i in range(n))]
+    for i, rung in enumerate(rungs):
+        graph.append(f"[v{i}]scale={rung['width']}:{rung['height']}:flags=lanczos[o{i}]")
+    graph.append(f"[v{n - 1}]scale=-2:{poster_h}:flags=lanczos[poster]")
+
+    cmd = ["ffmpeg", "-v", "error", "-y", "-i", src, "-filter_complex", ";".join(graph)]
+    # Every output appears at its final path only once the whole ladder has succeeded
+    with ExitStack() as outputs:
+        for i, rung in enumerate(rungs):
+            cmd += ["-map", f"[o{i}]", "-an", "-c:v", "libx264", "-preset", "slow", "-profile:v", "high",
+                    "-pix_fmt", "yuv420p", "-crf", str(rung["crf"]),
+                    "-maxrate", f"{rung['maxrate_kbps']}k", "-bufsize", f"{2 * rung['maxrate_kbps']}k",
+                    "-movflags", "+faststart",
+                    outputs.enter_context(atomic_output(rendition_path(src, rung["height"])))]
+        cmd += ["-map", "[poster]", "-frames:v", "1", "-q:v", "3",
+                outputs.enter_context(atomic_output(poster_path(src)))]
+        with stage("ladder", info["frame_count"] * len(rungs)):
+            ffmpeg_runner.run(cmd, name=f"{src} ladder", total_frames=info["frame_count"])
+
+    renditions = []
+    for rung in rungs:
+        path = rendition_path(src, rung["height"])
+        size = os.path.getsize(path)
+        renditions.append({
+            "src": path, "width": rung["width"], "height": rung["height"], "bytes": size,
+            "kbps": round(size * 8 / 1000 / info["duration"]) if info["duration"] else None,
+        })
+    return {
+        "width": info["width"], "height": info["height"], "duration": info["duration"],
+        "poster": poster_path(src), "renditions": renditions,
+    }
+
+
+# -----------------------------------------------------------------------------
+# HTML rewriting
+# -----------------------------------------------------------------------------
+
+# Skips the <noscript> copies written by an earlier run, so rewriting is idempotent
+_VIDEO_RE = re.compile(r'(?<!<noscript>)(<video\b[^>]*)>(\s*)<source src="([^"]+)"([^>]*?)\s*/?>(\s*)</video>', re.IGNORECASE)
+_NOSCRIPT_STYLE = "<noscript><style>video[data-renditions] { display: none; }</style></noscript>"
+
+
+def rewrite_html(path, manifest):
+    """Mark single-source <video> tags whose source has renditions for static/js/renditions.js."""
+    with open(path) as f:
+        html = f.read()
+    count = 0
+
+    def repl(m):
+        nonlocal count
+        video, ws, src, attrs, ws_end = m.groups()
+        if src not in manifest:
+            return m.group(0)
+        count += 1
+        return (f'{video} data-renditions>{ws}<source data-src="{src}"{attrs} />{ws_end}</video>'
+                f'<noscript>{m.group(0)}</noscript>')
+
+    html = _VIDEO_RE.sub(repl, html)
+    if count and _NOSCRIPT_STYLE not in html:
+        html = html.replace("</head>", f"  {_NOSCRIPT_STYLE}\n</head>", 1)
+    with atomic_output(path) as tmp, open(tmp, "w") as f:
+        f.write(html)
+    print(f"Rewrote {count} <video> tags in {path}")
+
+
+def main():
+    p = argparse.ArgumentParser(description="Build a rendition ladder, posters and manifest for the site videos.",
+                                formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    p.add_argument("--root", default=VIDEO_ROOT, help="Directory scanned for source videos")
+    p.add_argument("--heights", type=int, nargs="+", default=sorted(LADDER), help="Ladder heights")
+    p.add_argument("--manifest", default=MANIFEST, help="Manifest JSON read by static/js/renditions.js")
+    p.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 4),
+                   help="Videos encoded concurrently (each ffmpeg is multi-threaded already)")
+    p.add_argument("--html", nargs="*", default=[], help="Pages whose <video> tags are marked for renditions")
+    p.add_argument("--force", action="store_true", help="Ignore the build cache and re-encode everything")
+    p.add_argument("--trace", default=None, help="Write per-stage timings (Chrome trace JSON) to this path")
+    args = p.parse_args()
+    if args.trace:
+        media_trace.enable(args.trace)
+
+    cache = BuildCache(force=args.force)
+    manifest = {}
+    if os.path.exists(args.manifest):
+        with open(args.manifest) as f:
+            manifest = json.load(f)
+
+    sources = find_sources(args.root)
+    todo = []
+    for src in sources:
+        key = cache.key([src], {"heights": args.heights, "ladder": LADDER, "poster": POSTER_HEIGHT})
+        entry = manifest.get(src)
+        outputs = [poster_path(src)] + [r["src"] for r in entry["renditions"]] if entry else []
+        if entry and cache.is_fresh(f"ladder:{src}", key, outputs):
+            print(f"[cache] {src} renditions are up to date")
+        else:
+            todo.append((src, key))
+
+    def build(item):
+        src, key = item
+        try:
+            return src, key, build_video(src, args.heights)
+        except RuntimeError as e:  # FFmpegError, or a source that cannot be probed
+            print(f"❌ {src}: {e}")
+            return src, key, None
+
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        for src, key, entry in pool.map(build, todo):
+            if entry is None:
+                continue
+            manifest[src] = entry
+            cache.record(f"ladder:{src}", key, [entry["poster"]] + [r["src"] for r in entry["renditions"]])
+            sizes = ", ".join(f"{r['height']}p {r['bytes'] / 1e6:.1f} MB" for r in entry["renditions"])
+            print(f"✅ {src}: {sizes}")
+
+    # Drop entries whose source video was removed
+    manifest = {src: manifest[src] for src in sources if src in manifest}
+    with atomic_output(args.manifest) as tmp, open(tmp, "w") as f:
+        json.dump(manifest, f, indent=2)
+    print(f"Wrote {args.manifest} ({len(manifest)} videos)")
+
+    for page in args.html:
+        rewrite_html(page, manifest)
+
+
+if __name__ == "__main__":
+    main()
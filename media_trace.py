@@ -0,0 +1,129 @@
+"""
+media_trace.py ─ Opt-in per-stage timing for the media scripts.
+- `with stage("decode"):` records wall time, thread CPU time and a frame count.
+- Enabled by PIXIE_TRACE=<path.json> or a script's --trace flag; otherwise every
+  stage() call returns one shared no-op context manager.
+- At exit, writes a Chrome trace (chrome://tracing, Perfetto) and prints a summary table.
+- Only the first MAX_EVENTS calls become trace events; later calls still count in the
+  per-stage totals, so tracing a long render keeps memory bounded.
+"""
+
+import atexit
+import json
+import os
+import threading
+import time
+from contextlib import nullcontext
+
+
+ENV_VAR = "PIXIE_TRACE"
+MAX_EVENTS = 50_000  # ~25 MB of event dicts; a few minutes of per-frame stages at 30 fps
+
+_NULL = nullcontext()
+_enabled = False
+_path = None
+_lock = threading.Lock()
+_events = []
+_dropped = 0  # stage calls past MAX_EVENTS, counted in _stats only
+_stats = {}  # stage name -> [calls, frames, wall_s, cpu_s]
+_t0 = time.perf_counter()
+
+
+class _Stage:
+    __slots__ = ("name", "frames", "wall0", "cpu0")
+
+    def __init__(self, name, frames):
+        self.name = name
+        self.frames = frames
+
+    def __enter__(self):
+        self.wall0 = time.perf_counter()
+        self.cpu0 = time.thread_time()
+        return self
+
+    def __exit__(self, *exc):
+        global _dropped
+        wall = time.perf_counter() - self.wall0
+        cpu = time.thread_time() - self.cpu0
+        with _lock:
+            if len(_events) < MAX_EVENTS:
+                _events.append({
+                    "name": self.name, "ph": "X", "pid": os.getpid(), "tid": threading.get_ident(),
+                    "ts": (self.wall0 - _t0) * 1e6, "dur": wall * 1e6,
+                    "args": {"cpu_ms": cpu * 1e3, "frames": self.frames},
+                })
+            else:
+                _dropped += 1
+            st = _stats.setdefault(self.name, [0, 0, 0.0, 0.0])
+            st[0] += 1
+            st[1] += self.frames
+            st[2] += wall
+            st[3] += cpu
+        return False
+
+
+def stage(name: str, frames: int = 0):
+    """Context manager timing one occurrence of *name* (processing *frames* frames)."""
+    if not _enabled:
+        return _NULL
+    return _Stage(name, frames)
+
+
+def traced(iterable, name: str, frames: int = 1):
+    """Iterate *iterable*, timing each step (e.g. a decoder's next()) as one *name* stage."""
+    if not _enabled:
+        return iterable
+    return _traced(iter(iterable), name, frames)
+
+
+def _traced(it, name, frames):
+    while True:
+        with _Stage(name, frames) as st:
+            item = next(it, _NULL)
+            if item is _NULL:
+                st.frames = 0  # the step that found the end of the stream
+        if item is _NULL:
+            return
+        yield item
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def enable(path: str = "trace.json"):
+    """Turn tracing on; the trace is written to *path* when the process exits."""
+    global _enabled, _path
+    if not _enabled:
+        atexit.register(dump)
+    _enabled, _path = True, path
+
+
+def summary() -> str:
+    """Per-stage totals as a text table, slowest stage first."""
+    rows = sorted(_stats.items(), key=lambda kv: -kv[1][2])
+    lines = [f"{'stage':16s} {'calls':>8s} {'frames':>8s} {'wall s':>9s} {'cpu s':>9s} {'ms/frame':>9s} {'fps':>9s}"]
+    for name, (calls, frames, wall, cpu) in rows:
+        per = f"{wall / frames * 1e3:9.2f}" if frames else f"{'-':>9s}"
+        fps = f"{frames / wall:9.1f}" if frames and wall > 0 else f"{'-':>9s}"
+        lines.append(f"{name:16s} {calls:8d} {frames:8d} {wall:9.3f} {cpu:9.3f} {per} {fps}")
+    return "\n".join(lines)
+
+
+def dump():
+    """Write the Chrome trace and print the summary table."""
+    if not _enabled or not _events:
+        return
+    with _lock:
+        trace = {"traceEvents": list(_events), "displayTimeUnit": "ms", "droppedEvents": _dropped,
+                 "summary": {k: dict(zip(["calls", "frames", "wall_s", "cpu_s"], v)) for k, v in _stats.items()}}
+    with open(_path, "w") as f:
+        json.dump(trace, f)
+    print(summary())
+    if _dropped:
+        print(f"[WARN] trace keeps the first {MAX_EVENTS} stage calls; {_dropped} later ones are only in the totals")
+    print(f"Wrote trace to {_path}")
+
+
+if os.environ.get(ENV_VAR):
+    enable(os.environ[ENV_VAR])
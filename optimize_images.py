@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+optimize_images.py ─ Responsive, compressed variants of the page images.
+- For every PNG/JPEG in static/images, writes width-stepped AVIF, WebP and an
+  optimized fallback (JPEG, or PNG when the image has real transparency) plus a
+  small thumbnail.jpg, all under static/images/responsive/<name>/.
+- Images are processed in parallel; unchanged images are skipped by content hash.
+- Writes a srcset manifest (static/images/responsive/images.json).
+- --html rewrites <img src="static/images/..."> tags of a page into <picture>
+  elements using the manifest.
+"""
+
+import argparse
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image, features
+
+from build_cache import BuildCache
+from ffmpeg_runner import atomic_output
+
+IMAGE_ROOT = "static/images"
+OUT_ROOT = os.path.join(IMAGE_ROOT, "responsive")
+MANIFEST = os.path.join(OUT_ROOT, "images.json")
+
+WIDTHS = [480, 960, 1600, 2400]
+THUMB_WIDTH = 320
+QUALITY = {"avif": 60, "webp": 80, "jpg": 82}
+SIZES = "100vw"
+
+
+def find_images(root=IMAGE_ROOT):
+    """PNG/JPEG sources directly in *root* (variants live in a subdirectory and are not picked up)."""
+    return sorted(os.path.join(root, f) for f in os.listdir(root)
+                  if f.lower().endswith((".png", ".jpg", ".jpeg")))
+
+
+def has_alpha(im):
+    if im.mode in ("RGBA", "LA") or (im.mode == "P" and "transparency" in im.info):
+        return im.convert("RGBA").getchannel("A").getextrema()[0] < 255
+    return False
+
+
+def step_widths(width, widths):
+    """Widths not above the source; the source width itself tops the list."""
+    return [w for w in sorted(widths) if w < width] + [width]
+
+
+def _save(im, path, fmt):
+    if fmt == "avif":
+        im.save(path, "AVIF", quality=QUALITY["avif"], speed=6)
+    elif fmt == "webp":
+        im.save(path, "WEBP", quality=QUALITY["webp"], method=4)
+    elif fmt == "jpg":
+        im.save(path, "JPEG", quality=QUALITY["jpg"], optimize=True, progressive=True)
+    else:
+        im.save(path, "PNG", optimize=True)
+
+
+def optimize_image(src, widths, formats, out_root=OUT_ROOT):
+    """Write all variants of *src*; return its manifest entry."""
+    name = os.path.splitext(os.path.basename(src))[0]
+    out_dir = os.path.join(out_root, name)
+    os.makedirs(out_dir, exist_ok=True)
+
+    with Image.open(src) as im:
+        im.load()
+        alpha = has_alpha(im)
+        im = im.convert("RGBA" if alpha else "RGB")
+    fallback = "png" if alpha else "jpg"
+    flat = im
+    if alpha:
+        flat = Image.new("RGB", im.size, (255, 255, 255))
+        flat.paste(im, mask=im.getchannel("A"))
+
+    variants = {fmt: [] for fmt in [*formats, fallback]}
+    for w in step_widths(im.width, widths):
+        h = round(im.height * w / im.width)
+        scaled = im if w == im.width else im.resize((w, h), Image.LANCZOS)
+        for fmt in variants:
+            path = os.path.join(out_dir, f"{w}.{fmt}")
+            _save(scaled, path, fmt)
+            variants[fmt].append({"src": path, "width": w, "bytes": os.path.getsize(path)})
+
+    thumb = flat.copy()
+    thumb.thumbnail((THUMB_WIDTH, THUMB_WIDTH * im.height // im.width + 1), Image.LANCZOS)
+    thumb_path = os.path.join(out_dir, "thumbnail.jpg")
+    _save(thumb, thumb_path, "jpg")
+
+    return {
+        "width": im.width,
+        "height": im.height,
+        "original_bytes": os.path.getsize(src),
+        "fallback": fallback,
+        "thumbnail": thumb_path,
+        "srcset": {fmt: ", ".join(f"{v['src']} {v['width']}w" for v in vs) for fmt, vs in variants.items()},
+        "variants": variants,
+    }
+
+
+def _optimize_task(task):
+    src, widths, formats, out_root = task
+    try:
+        return src, optimize_image(src, widths, formats, out_root), None
+    except (OSError, ValueError) as e:
+        return src, None, f"{type(e).__name__}: {e}"
+
+
+# -----------------------------------------------------------------------------
+# HTML rewriting
+# -----------------------------------------------------------------------------
+
+_MIME = {"avif": "image/avif", "webp": "image/webp"}
+_IMG_RE = re.compile(r'<img src="(static/images/[^"/]+\.(?:png|jpe?g))"([^>]*?)\s*/?>', re.IGNORECASE)
+
+
+def picture_html(src, entry, attrs, lazy=True):
+    """<picture> markup for one manifest entry, keeping the original <img> attributes."""
+    sources = "".join(f'<source type="{_MIME[fmt]}" srcset="{entry["srcset"][fmt]}" sizes="{SIZES}" />'
+                      for fmt in _MIME if fmt in entry["srcset"])
+    largest = entry["variants"][entry["fallback"]][-1]["src"]
+    extra = ' loading="lazy"' if lazy else ""
+    return (f'<picture>{sources}<img src="{largest}" srcset="{entry["srcset"][entry["fallback"]]}" '
+            f'sizes="{SIZES}" width="{entry["width"]}" height="{entry["height"]}" decoding="async"{extra}'
+            f'{attrs} /></picture>')
+
+
+def rewrite_html(path, manifest):
+    """Replace <img> tags that point at optimized originals with <picture> elements."""
+    with open(path) as f:
+        html = f.read()
+    count = 0
+
+    def repl(m):
+        nonlocal count
+        entry = manifest.get(m.group(1))
+        if entry is None:
+            return m.group(0)
+        count += 1
+        # The first image is usually above the fold; don't delay it
+        return picture_html(m.group(1), entry, m.group(2), lazy=count > 1)
+
+    html = _IMG_RE.sub(repl, html)
+    with atomic_output(path) as tmp, open(tmp, "w") as f:
+        f.write(html)
+    print(f"Rewrote {count} <img> tags in {path}")
+
+
+def main():
+    p = argparse.ArgumentParser(description="Build responsive image variants and a srcset manifest.",
+                                formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    p.add_argument("--root", default=IMAGE_ROOT, help="Directory with the source images")
+    p.add_argument("--out", default=OUT_ROOT, help="Where variants are written")
+    p.add_argument("--widths", type=int, nargs="+", default=WIDTHS, help="Variant widths (never upscaled)")
+    p.add_argument("--formats", nargs="+", default=["avif", "webp"], choices=["avif", "webp"],
+                   help="Modern formats emitted besides the JPEG/PNG fallback")
+    p.add_argument("--workers", type=int, default=os.cpu_count(), help="Images processed in parallel")
+    p.add_argument("--html", nargs="*", default=[], help="Pages whose <img> tags are rewritten to <picture>")
+    p.add_argument("--force", action="store_true", help="Ignore the build cache and rebuild every image")
+    args = p.parse_args()
+
+    formats = [f for f in args.formats if features.check(f)]
+    for f in set(args.formats) - set(formats):
+        print(f"[WARN] Pillow was built without {f} support; skipping {f} variants")
+
+    manifest_path = os.path.join(args.out, "images.json")
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+
+    cache = BuildCache(force=args.force)
+    sources = find_images(args.root)
+    tasks, keys = [], {}
+    for src in sources:
+        keys[src] = cache.key([src], {"widths": args.widths, "formats": formats, "quality": QUALITY,
+                                      "thumb": THUMB_WIDTH, "out": args.out})
+        entry = manifest.get(src)
+        outputs = [v["src"] for vs in entry["variants"].values() for v in vs] + [entry["thumbnail"]] if entry else []
+        if entry and cache.is_fresh(f"images:{src}", keys[src], outputs):
+            print(f"[cache] {src} is up to date")
+        else:
+            tasks.append((src, args.widths, formats, args.out))
+
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        for src, entry, err in pool.map(_optimize_task, tasks):
+            if err:
+                print(f"❌ {src}: {err}")
+                continue
+            manifest[src] = entry
+            outputs = [v["src"] for vs in entry["variants"].values() for v in vs] + [entry["thumbnail"]]
+            cache.record(f"images:{src}", keys[src], outputs)
+            best = min((vs[-1] for vs in entry["variants"].values()), key=lambda v: v["bytes"])
+            print(f"✅ {src}: {entry['original_bytes'] / 1e6:.2f} MB → {best['bytes'] / 1e6:.2f} MB "
+                  f"({os.path.splitext(best['src'])[1][1:]}, full width)")
+
+    manifest = {src: manifest[src] for src in sources if src in manifest}
+    os.makedirs(args.out, exist_ok=True)
+    with atomic_output(manifest_path) as tmp, open(tmp, "w") as f:
+        json.dump(manifest, f, indent=2)
+    total = sum(e["original_bytes"] for e in manifest.values())
+    print(f"Wrote {manifest_path} ({len(manifest)} images, {total / 1e6:.1f} MB of originals)")
+
+    for page in args.html:
+        rewrite_html(page, manifest)
+
+
+if __name__ == "__main__":
+    main()
@@ -19,7 +19,8 @@ const videoNames = [
     "dog"
 ];
 
-/* Map from scene → video path (concatenated RGB|material|E|density|nu) */
+/* Map from scene → video path (concatenated RGB|material|E|density|nu); the
+   scene's renditions manifest is looked up next to it */
 const videoPathMap = {
     vasedeck: "static/videos/ours_real_world/renders/vasedeck/concat.mp4",
     bonsai: "static/videos/ours_real_world/renders/bonsai/concat.mp4",
@@ -29,37 +30,99 @@ const videoPathMap = {
     dog: "static/videos/ours_real_world/renders/dog/concat.mp4"
 };
 
-let videos = [];
+/* Per-scene manifest written by make_realworld_web_viz.py. When a scene has one,
+   only the two-pane "RGB | feature" rendition on screen is downloaded; scenes
+   without it fall back to the five-pane concat.mp4. */
+const MANIFEST_NAME = "renditions.json";
+/* <video> elements kept buffered; older ones are released so flipping through
+   scenes and features doesn't hold every download in memory */
+const MAX_CACHED_VIDEOS = 3;
+
+let manifests = {};        // scene → Promise<manifest | null>
+let videoCache = new Map(); // src → <video>, least recently used first
+let currentVideo = null;   // video being drawn
+let pendingVideo = null;   // video switched to, drawn once it can show a frame
 let currentVideoIdx = 0;
 // Width of the displayed canvas (updated on resize)
 // Which feature to show on the right pane: 0-material, 1-E, 2-density, 3-nu
 let displayLevel = 0;
 
-function buildHiddenVideos() {
-    const realSection = document.getElementById("real");
-    if (!realSection) return;
-    const frag = document.createDocumentFragment();
-    videoNames.forEach((name) => {
-        const vid = document.createElement("video");
-        vid.id = name;
+function sceneDir(name) {
+    return videoPathMap[name].replace(/concat\.mp4$/, "");
+}
+
+function loadManifest(name) {
+    if (!(name in manifests)) {
+        manifests[name] = fetch(sceneDir(name) + MANIFEST_NAME)
+            .then((r) => (r.ok ? r.json() : null))
+            .catch(() => null);
+    }
+    return manifests[name];
+}
+
+/* Drop the least recently used videos beyond MAX_CACHED_VIDEOS, never the one on screen. */
+function evictVideos() {
+    for (const [src, vid] of videoCache) {
+        if (videoCache.size <= MAX_CACHED_VIDEOS) break;
+        if (vid === currentVideo || vid === pendingVideo) continue;
+        vid.pause();
+        vid.removeAttribute("src");
+        vid.load();            // aborts the download and frees the buffered media
+        vid.remove();
+        videoCache.delete(src);
+    }
+}
+
+function getVideo(src, layout) {
+    let vid = videoCache.get(src);
+    if (vid) {
+        videoCache.delete(src);  // re-inserted below as most recently used
+    } else {
+        vid = document.createElement("video");
         vid.className = "videos";
         vid.muted = true;
         vid.loop = true;
-        vid.autoplay = true;
+        vid.preload = "auto";
         vid.setAttribute("playsinline", "");
         vid.style.display = "none";
-
-        const source = document.createElement("source");
-        source.src = videoPathMap[name];
-        source.type = "video/mp4";
-        vid.appendChild(source);
-        frag.appendChild(vid);
-    });
-    realSection.appendChild(frag);
+        vid.dataset.layout = layout;
+        vid.src = src;
+        document.getElementById("real").appendChild(vid);
+    }
+    videoCache.set(src, vid);
+    return vid;
 }
 
-function loadVideos() {
-    videos = videoNames.map((n) => document.getElementById(n));
+/* Show the current scene/feature; newScene restarts playback from the beginning. */
+async function showCurrent(newScene) {
+    const name = videoNames[currentVideoIdx];
+    const level = displayLevel;
+    const manifest = await loadManifest(name);
+    if (name !== videoNames[currentVideoIdx] || level !== displayLevel) return; // user moved on
+
+    const feature = manifest && manifest.features[level];
+    const vid = feature
+        ? getVideo(sceneDir(name) + feature.src, "pair")
+        : getVideo(videoPathMap[name], "concat");
+    const old = pendingVideo || currentVideo;
+    if (vid === old && !newScene) return;
+
+    const startTime = newScene || !old ? 0 : old.currentTime;
+    const paused = !newScene && old ? old.paused : false;
+    pendingVideo = vid;
+    evictVideos();
+    const ready = () => {
+        if (pendingVideo !== vid || vid.readyState < 2 || vid.seeking) return;
+        pendingVideo = null;
+        if (currentVideo && currentVideo !== vid) currentVideo.pause();
+        currentVideo = vid;
+        update_play_icon();
+        evictVideos();
+    };
+    ["loadeddata", "seeked", "canplay"].forEach((e) => vid.addEventListener(e, ready, { once: true }));
+    vid.currentTime = startTime;
+    if (!paused) vid.play().catch(() => {});
+    ready();
 }
 
 function resizeCanvas() {
@@ -81,12 +144,9 @@ function resizeCanvas() {
 }
 
 window.addEventListener("load", () => {
-    buildHiddenVideos();
+    if (!document.getElementById("real")) return;
     resizeCanvas();
-    loadVideos();
-    if (videos[0]) {
-        videos[0].play();
-    }
+    showCurrent(true);
 });
 
 window.addEventListener("resize", resizeCanvas);
@@ -111,7 +171,7 @@ $(function () {
 
     /* Draw loop */
     setInterval(() => {
-        if (videos.length === 0) return;
+        if (!currentVideo) return;
         const $parent = $("#image-compare-canvas");
         const $handle = $parent.find(".image-compare-handle");
         const currentLeft = $handle.position().left;
@@ -139,11 +199,15 @@ $(function () {
 
         const canvas = document.getElementById("canvas");
         const ctx = canvas.getContext("2d");
-        const video = videos[currentVideoIdx];
-        if (!video) return;
+        const video = currentVideo;
+
+        /* Two-pane renditions hold [RGB | feature]; the concat fallback holds all five panes. */
+        const pair = video.dataset.layout === "pair";
+        const segmentCount = pair ? 2 : SEGMENT_COUNT;
+        const featureSegment = pair ? 1 : displayLevel + 1;
 
         /* Calculate per-segment dimensions based on the actual video resolution. */
-        const segmentWidth = (video.videoWidth || 960) / SEGMENT_COUNT;
+        const segmentWidth = (video.videoWidth || PANE_WIDTH * segmentCount) / segmentCount;
         const segmentHeight = video.videoHeight || 520;
 
         /* Map handle position (newLeft) from canvas space → video segment space. */
@@ -165,7 +229,7 @@ $(function () {
         /* Draw selected feature (right pane) */
         ctx.drawImage(
             video,
-            segmentWidth * (displayLevel + 1) + scaledLeft,
+            segmentWidth * featureSegment + scaledLeft,
             0,
             segmentWidth - scaledLeft,
             segmentHeight,
@@ -216,6 +280,7 @@ $(function () {
             }).on("click", () => {
                 $current.addClass("switcher-hidden");
                 displayLevel = childIdx;
+                showCurrent(false);
                 $current = $().add($child).add($input).add($label);
                 $current.removeClass("switcher-hidden");
             });
@@ -244,10 +309,7 @@ $(function () {
                 $(".thumbnail-btn").removeClass("active");
                 btn.addClass("active");
                 currentVideoIdx = childIdx;
-                const vid = videos[currentVideoIdx];
-                vid.currentTime = 0;
-                vid.play();
-                update_play_icon();
+                showCurrent(true);
             });
             const img = $("<img>", { class: "thumbnails", src: $child.data("img-src"), alt: $child.data("label") });
             const label = $("<span>", { class: "thumbnail_label", text: $child.data("label") });
@@ -273,7 +335,7 @@ function results_slide_right() {
 /* Basic video controls */
 function update_play_icon() {
     const btn = document.getElementById("play-btn");
-    const vid = videos[currentVideoIdx];
+    const vid = currentVideo;
     if (!btn || !vid) return;
     if (vid.paused) {
         btn.classList.remove("fa-pause");
@@ -285,7 +347,7 @@ function update_play_icon() {
 }
 
 function play_pause() {
-    const vid = videos[currentVideoIdx];
+    const vid = currentVideo;
     if (!vid) return;
     if (vid.paused) vid.play();
     else vid.pause();
@@ -293,7 +355,7 @@ function play_pause() {
 }
 
 function fullscreen() {
-    const vid = videos[currentVideoIdx];
+    const vid = currentVideo;
     if (!vid) return;
     if (document.fullscreenElement) document.exitFullscreen();
     else vid.requestFullscreen();
@@ -0,0 +1,41 @@
+/* Viewport-aware video renditions – reads the manifest written by make_renditions.py */
+
+const RENDITIONS_MANIFEST = "static/videos/renditions.json";
+
+/* Smallest rendition at least as tall as the video is drawn (in device pixels), else the largest. */
+function pickRendition(entry, vid) {
+    const sorted = entry.renditions.slice().sort((a, b) => a.height - b.height);
+    if (vid.offsetParent === null) return sorted[0]; // hidden (e.g. the mobile-only teaser)
+    const dpr = window.devicePixelRatio || 1;
+    const drawnWidth = vid.clientWidth || vid.parentElement.clientWidth || window.innerWidth;
+    const drawnHeight = vid.clientHeight || (drawnWidth * entry.height) / entry.width;
+    const needed = Math.max(drawnHeight, (drawnWidth * entry.height) / entry.width) * dpr;
+    return sorted.find((r) => r.height >= needed) || sorted[sorted.length - 1];
+}
+
+/* `make_renditions.py --html` marks the videos it built renditions for with data-renditions
+   and moves their URL to <source data-src>, so nothing is downloaded before a rendition is
+   chosen here; a <noscript> copy with the plain source follows each of them. */
+function startVideo(vid, manifest) {
+    const source = vid.querySelector("source[data-src]");
+    if (!source) return;
+    const original = source.dataset.src;
+    const entry = manifest && manifest[original];
+    if (entry) {
+        vid.poster = entry.poster;
+        source.src = pickRendition(entry, vid).src;
+    } else {
+        source.src = original;
+    }
+    vid.load();
+    if (vid.autoplay) vid.play().catch(() => {});
+}
+
+document.addEventListener("DOMContentLoaded", () => {
+    const vids = document.querySelectorAll("video[data-renditions]");
+    if (!vids.length) return; // page was not built with renditions: no manifest to fetch
+    fetch(RENDITIONS_MANIFEST)
+        .then((r) => (r.ok ? r.json() : null))
+        .catch(() => null)
+        .then((manifest) => vids.forEach((vid) => startVideo(vid, manifest)));
+});
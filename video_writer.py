@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+"""
+video_writer.py ─ One frame-writer interface over the ways the renderers encode video.
+- open_writer(path, (w, h), fps, backend) returns a writer with write(frame) and close().
+  Frames are BGR uint8 as OpenCV produces them (input_format="rgb24" for RGB sources);
+  each backend does any colour conversion it needs, so renderers never do.
+- Backends:
+    ffmpeg   raw frames piped into an ffmpeg subprocess; bgr24 goes in as-is and swscale
+             converts straight to the output pix_fmt
+    imageio  imageio-ffmpeg writer (RGB in, so BGR frames are converted per frame)
+    opencv   cv2.VideoWriter with a fourcc (mp4v does not play in browsers; avc1 only
+             works when OpenCV was built with an H.264 encoder)
+- Options: codec, preset, threads, crf or bitrate, pix_fmt, extra_args (ffmpeg/imageio) and
+  fourcc (opencv).
+- Running this file calibrates: it encodes a synthetic clip with every backend (and any
+  hardware H.264 encoder ffmpeg offers), checks which outputs are browser-playable H.264
+  within SSIM_TOLERANCE of the best quality reached, and writes the fastest of those to
+  encoder_calibration.json. backend="auto" uses that choice, falling back to the ffmpeg
+  backend when no calibration exists.
+"""
+
+import argparse
+import json
+import os
+import platform
+import re
+import subprocess
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+BACKENDS = ["ffmpeg", "imageio", "opencv"]
+DEFAULT_BACKEND = "ffmpeg"
+CALIBRATION = "encoder_calibration.json"
+
+DEFAULT_OPTIONS = {
+    "codec": "libx264",
+    "preset": "medium",
+    "threads": 0,          # 0: let the encoder decide
+    "crf": None,
+    "bitrate": None,       # e.g. "8M"; used instead of crf when given
+    "pix_fmt": "yuv420p",
+    "fourcc": "avc1",      # opencv backend only
+    "extra_args": None,    # further encoder arguments, e.g. ["-profile:v", "high"] (ffmpeg/imageio)
+}
+
+# Hardware H.264 encoders tried during calibration when ffmpeg lists them
+HW_ENCODERS = ["h264_nvenc", "h264_videotoolbox", "h264_qsv"]
+# A calibration candidate must reach the best candidate's mean SSIM minus this to be eligible
+SSIM_TOLERANCE = 0.01
+SSIM_EVERY = 10            # score every 10th frame of the calibration clip
+# What <video> plays everywhere: H.264 in 8-bit 4:2:0 with a non-4:4:4 profile
+PLAYABLE_PROFILES = {"Constrained Baseline", "Baseline", "Main", "High"}
+
+
+def resolve(backend="auto", **options):
+    """(backend, full option dict) a writer would use. Options left as None keep their
+    defaults, or the calibrated ones for backend="auto"."""
+    calibrated = {}
+    if backend == "auto":
+        backend, calibrated = calibrated_choice()
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown video writer backend '{backend}' (choose from {', '.join(BACKENDS)})")
+    return backend, {**DEFAULT_OPTIONS, **calibrated, **{k: v for k, v in options.items() if v is not None}}
+
+
+def calibrated_choice(path=CALIBRATION):
+    """Backend and options picked by the last calibration on this machine."""
+    if os.path.exists(path):
+        with open(path) as f:
+            best = json.load(f).get("best")
+        if best:
+            return best["backend"], best["options"]
+    return DEFAULT_BACKEND, {}
+
+
+def open_writer(path, size, fps, backend="auto", input_format="bgr24", **options):
+    """Writer for *size* = (width, height) frames at *fps*; see the module docstring."""
+    backend, opts = resolve(backend, **options)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    cls = {"ffmpeg": FFmpegPipeWriter, "imageio": ImageioWriter, "opencv": OpenCVWriter}[backend]
+    return cls(str(path), size, fps, opts, input_format)
+
+
+def _quality_args(codec, crf):
+    """Constant-quality arguments for *codec* at roughly the quality of x264 at *crf*.
+
+    Only libx264/libx265 understand -crf; the hardware encoders silently ignore it and
+    fall back to a low default bitrate, so each gets its own rate control.
+    """
+    if codec == "h264_nvenc":
+        return ["-rc", "vbr", "-cq", str(crf), "-b:v", "0"]
+    if codec == "h264_qsv":
+        return ["-global_quality", str(crf)]
+    if codec == "h264_videotoolbox":
+        return ["-q:v", str(max(1, min(100, 100 - 2 * crf)))]  # 1-100, higher is better
+    return ["-crf", str(crf)]
+
+
+def _encoder_args(opts):
+    args = ["-c:v", opts["codec"]]
+    if opts["codec"].startswith("libx26"):
+        args += ["-preset", opts["preset"]]
+    if opts["threads"]:
+        args += ["-threads", str(opts["threads"])]
+    if opts["bitrate"]:
+        args += ["-b:v", str(opts["bitrate"])]
+    elif opts["crf"] is not None:
+        args += _quality_args(opts["codec"], opts["crf"])
+    return args + ["-pix_fmt", opts["pix_fmt"], *(opts["extra_args"] or [])]
+
+
+class FFmpegPipeWriter:
+    """Raw frames on ffmpeg's stdin; no per-frame conversion or copy in Python."""
+
+    def __init__(self, path, size, fps, opts, input_format="bgr24"):
+        self.path = path
+        self.size = tuple(size)
+        cmd = [
+            "ffmpeg", "-v", "error", "-y",
+            "-f", "rawvideo", "-pix_fmt", input_format, "-s", f"{size[0]}x{size[1]}", "-r", str(fps), "-i", "-",
+            "-an", *_encoder_args(opts), "-movflags", "+faststart", path,
+        ]
+        self.proc = subprocess.Popen(cmd, stdin=subprocess.PIPE)
+
+    def write(self, frame):
+        if frame.shape[1::-1] != self.size:
+            raise ValueError(f"Frame is {frame.shape[1]}x{frame.shape[0]}, writer expects {self.size[0]}x{self.size[1]}")
+        try:
+            self.proc.stdin.write(np.ascontiguousarray(frame).data)
+        except BrokenPipeError:
+            self.close()  # raises with ffmpeg's exit code
+            raise         # ffmpeg exited 0 without reading every frame
+
+    def close(self):
+        if self.proc.stdin and not self.proc.stdin.closed:
+            try:
+                self.proc.stdin.close()
+            except BrokenPipeError:
+                pass
+        ret = self.proc.wait()
+        if ret != 0:
+            raise RuntimeError(f"ffmpeg failed with exit code {ret} while encoding {self.path}")
+
+
+class ImageioWriter:
+    """imageio-ffmpeg writer; it takes RGB, so BGR input is converted per frame."""
+
+    def __init__(self, path, size, fps, opts, input_format="bgr24"):
+        import imageio.v2 as imageio  # only this backend needs it
+
+        params = ["-preset", opts["preset"]] if opts["codec"].startswith("libx26") else []
+        if opts["threads"]:
+            params += ["-threads", str(opts["threads"])]
+        if opts["crf"] is not None and not opts["bitrate"]:
+            params += _quality_args(opts["codec"], opts["crf"])
+        params += opts["extra_args"] or []
+        self.writer = imageio.get_writer(
+            path, fps=fps, codec=opts["codec"], bitrate=opts["bitrate"], quality=None,
+            pixelformat=opts["pix_fmt"], ffmpeg_params=params + ["-movflags", "+faststart"],
+            macro_block_size=None,  # allow arbitrary resolution
+        )
+        self.bgr = input_format == "bgr24"
+        self.rgb = np.empty((size[1], size[0], 3), dtype=np.uint8)
+
+    def write(self, frame):
+        self.writer.append_data(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=self.rgb) if self.bgr else frame)
+
+    def close(self):
+        self.writer.close()
+
+
+class OpenCVWriter:
+    """cv2.VideoWriter; only the fourcc is configurable."""
+
+    def __init__(self, path, size, fps, opts, input_format="bgr24"):
+        self.path = path
+        self.writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*opts["fourcc"]), fps, tuple(size))
+        if not self.writer.isOpened():
+            raise RuntimeError(f"OpenCV cannot encode fourcc '{opts['fourcc']}' to {path}")
+        self.rgb = input_format == "rgb24"
+        self.bgr = np.empty((size[1], size[0], 3), dtype=np.uint8)
+
+    def write(self, frame):
+        self.writer.write(cv2.cvtColor(frame, cv2.COLOR_RGB2BGR, dst=self.bgr) if self.rgb else frame)
+
+    def close(self):
+        self.writer.release()
+
+
+# -----------------------------------------------------------------------------
+# Calibration
+# -----------------------------------------------------------------------------
+
+
+def probe_codec(path):
+    """(codec, profile, pix_fmt) of the first video stream, read from `ffmpeg -i` (no ffprobe needed)."""
+    err = subprocess.run(["ffmpeg", "-hide_banner", "-i", path], capture_output=True, text=True).stderr
+    m = re.search(r"Video: (\w+)(?: \(([^)]*)\))?.*?, (\w+)(?:\(|,)", err)
+    return (m.group(1), m.group(2), m.group(3)) if m else (None, None, None)
+
+
+def browser_playable(path):
+    codec, profile, pix_fmt = probe_codec(path)
+    return codec == "h264" and pix_fmt in ("yuv420p", "yuvj420p") and profile in PLAYABLE_PROFILES
+
+
+def synthetic_frames(size, count):
+    """Moving gradients plus fixed noise: roughly as hard to encode as the renders."""
+    w, h = size
+    rng = np.random.RandomState(0)
+    noise = rng.randint(0, 24, (h, w, 3), dtype=np.uint8)
+    xs, ys = np.arange(w)[None, :], np.arange(h)[:, None]
+    frames = []
+    for i in range(count):
+        base = ((xs * 2 + ys + i * 6) % 224).astype(np.uint8)
+        frame = np.stack([base, 223 - base, (base + i) % 224], axis=-1).astype(np.uint8)
+        frames.append(frame + noise)
+    return frames
+
+
+def mean_ssim(path, frames, every=SSIM_EVERY):
+    """Mean luma SSIM of every *every*-th decoded frame of *path* against *frames*; None if
+    the file decodes to fewer frames."""
+    from crf_search import ssim  # crf_search imports this module
+
+    cap = cv2.VideoCapture(path)
+    scores = []
+    for i, ref in enumerate(frames):
+        ok, dec = cap.read()
+        if not ok:
+            break
+        if i % every == 0:
+            scores.append(ssim(ref, dec))
+    else:
+        cap.release()
+        return float(np.mean(scores))
+    cap.release()
+    return None
+
+
+def calibration_candidates(options):
+    """(backend, options) pairs to time; hardware encoders only when ffmpeg lists them."""
+    candidates = [("ffmpeg", options), ("imageio", options),
+                  ("opencv", {**options, "fourcc": "avc1"}), ("opencv", {**options, "fourcc": "mp4v"})]
+    try:
+        encoders = subprocess.run(["ffmpeg", "-hide_banner", "-encoders"], capture_output=True, text=True).stdout
+    except FileNotFoundError:
+        return [c for c in candidates if c[0] == "opencv"]
+    for enc in HW_ENCODERS:
+        if re.search(rf"\b{enc}\b", encoders):
+            candidates.append(("ffmpeg", {**options, "codec": enc}))
+    return candidates
+
+
+def calibrate(size=(960, 540), count=150, fps=30, out=CALIBRATION, **options):
+    """Time and score every candidate on this machine; write and return the calibration record."""
+    frames = synthetic_frames(size, count)
+    results = []
+    with tempfile.TemporaryDirectory(prefix="encoder_calibration_") as tmp:
+        for i, (backend, opts) in enumerate(calibration_candidates(options)):
+            backend, opts = resolve(backend, **opts)
+            label = f"{backend}/{opts['fourcc'] if backend == 'opencv' else opts['codec']}"
+            path = os.path.join(tmp, f"{i}.mp4")
+            res = {"backend": backend, "options": opts, "label": label}
+            try:
+                t0 = time.perf_counter()
+                writer = open_writer(path, size, fps, backend, **opts)
+                for frame in frames:
+                    writer.write(frame)
+                writer.close()
+                wall = time.perf_counter() - t0
+            except (RuntimeError, ValueError, OSError) as e:
+                res["error"] = f"{type(e).__name__}: {e}"
+                print(f"❌ {label:24s} {res['error']}")
+                results.append(res)
+                continue
+            codec, profile, pix_fmt = probe_codec(path)
+            res.update(fps=count / wall, bytes=os.path.getsize(path), codec=codec, profile=profile,
+                       pix_fmt=pix_fmt, playable=browser_playable(path), ssim=mean_ssim(path, frames))
+            results.append(res)
+            flag = "" if res["playable"] else "  (not browser-playable)"
+            score = f"SSIM {res['ssim']:.4f}" if res["ssim"] is not None else "SSIM n/a"
+            print(f"{'✅' if res['playable'] else '⚠️ '} {label:24s} {res['fps']:8.1f} fps  "
+                  f"{res['bytes'] / 1e6:6.2f} MB  {score}  {codec} {profile or ''} {pix_fmt}{flag}")
+
+    # Speed only counts at matching quality: a faster encoder that reaches it by spending
+    # fewer bits (e.g. a hardware encoder at its default bitrate) is not eligible
+    playable = [r for r in results if r.get("playable") and r.get("ssim") is not None]
+    floor = max((r["ssim"] for r in playable), default=0.0) - SSIM_TOLERANCE
+    for r in playable:
+        r["eligible"] = r["ssim"] >= floor
+        if not r["eligible"]:
+            print(f"[WARN] {r['label']}: SSIM {r['ssim']:.4f} is below {floor:.4f}; not eligible")
+    eligible = [r for r in playable if r["eligible"]]
+    best = max(eligible, key=lambda r: r["fps"]) if eligible else None
+    record = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "machine": {"platform": platform.platform(), "cpus": os.cpu_count()},
+        "size": list(size), "frames": count,
+        "results": results,
+        "best": {"backend": best["backend"], "options": best["options"]} if best else None,
+    }
+    with open(out, "w") as f:
+        json.dump(record, f, indent=2)
+    if best:
+        print(f"Fastest browser-playable encoder at matching quality: {best['label']} ({best['fps']:.1f} fps); wrote {out}")
+    else:
+        print(f"[WARN] No backend produced browser-playable H.264; backend=auto keeps using {DEFAULT_BACKEND}")
+    return record
+
+
+def cli(argv=None):
+    p = argparse.ArgumentParser(description="Time each video writer backend and pick the fastest browser-playable one.",
+                                formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    p.add_argument("--size", default="960x540", help="Frame size WxH of the synthetic test clip")
+    p.add_argument("--frames", type=int, default=150, help="Frames encoded per backend")
+    p.add_argument("--preset", default=DEFAULT_OPTIONS["preset"], help="x264 preset used by the ffmpeg/imageio backends")
+    p.add_argument("--crf", type=int, default=18, help="Quality used for the test encodes")
+    p.add_argument("--threads", type=int, default=0, help="Encoder threads (0 = encoder default)")
+    p.add_argument("--out", default=CALIBRATION, help="Calibration JSON read by backend=auto")
+    args = p.parse_args(argv)
+    w, h = (int(v) for v in args.size.lower().split("x"))
+    calibrate((w, h), args.frames, out=args.out, preset=args.preset, crf=args.crf, threads=args.threads)
+
+
+if __name__ == "__main__":
+    cli()